@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+#
+# Size versus store/load time of the cache codecs on synthetic OHLCV data
+# shaped like what PickleCache stores for daily and minute bars.
+#
+#   python benchmarks/compression.py [runs]
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from eoddata import compression  # noqa
+
+
+def ohlcv(index, symbol='MSFT', price=40.0):
+    rows = len(index)
+    close = price + np.cumsum(np.random.normal(0, 0.01 * price, rows))
+    close = np.round(np.abs(close) + 1, 2)
+    spread = np.round(np.abs(np.random.normal(0, 0.005 * price, rows)), 2)
+
+    return pd.DataFrame({'symbol': symbol,
+                         'open': np.round(close + spread / 2, 2),
+                         'high': close + spread,
+                         'low': close - spread,
+                         'close': close,
+                         'volume': np.random.randint(100, 10 ** 6, rows),
+                         'open_interest': 0},
+                        index=index,
+                        columns=['symbol', 'open', 'high', 'low', 'close',
+                                 'volume', 'open_interest'])
+
+
+def daily():
+    return ohlcv(pd.bdate_range('1994-01-03', '2013-12-31'))
+
+
+def minute():
+    index = pd.date_range('2013-01-02', '2013-12-31 23:59', freq='T')
+    index = index[index.indexer_between_time('09:30', '15:59')]
+    return ohlcv(index[index.weekday < 5])
+
+
+def codecs():
+    yield 'none', 0
+
+    for name in sorted(compression.CODECS):
+        if name == 'none':
+            continue
+
+        for level in (1, 6, 9):
+            yield name, level
+
+
+def bench(frame, directory, runs):
+    filename = os.path.join(directory, 'bench.pkl')
+    results = []
+
+    for codec, level in codecs():
+        stores, loads = [], []
+
+        for _ in range(runs):
+            start = time.time()
+            size = compression.dump(frame, filename, codec, level)
+            stores.append(time.time() - start)
+
+            start = time.time()
+            compression.load(filename)
+            loads.append(time.time() - start)
+
+        results.append((codec, level, size, min(stores), min(loads)))
+
+    return results
+
+
+def report(label, frame, results):
+    raw = float(results[0][2])
+    print('%s: %d rows' % (label, len(frame)))
+    print('  %-6s %5s %12s %7s %10s %10s' % ('codec', 'level', 'bytes',
+                                             'ratio', 'store ms',
+                                             'load ms'))
+
+    for codec, level, size, store, load in results:
+        print('  %-6s %5d %12d %7.2f %10.1f %10.1f' % (codec, level, size,
+                                                        raw / size,
+                                                        store * 1000,
+                                                        load * 1000))
+
+
+def main(runs=3):
+    np.random.seed(42)
+    directory = tempfile.mkdtemp()
+
+    try:
+        for label, frame in (('daily', daily()), ('minute', minute())):
+            report(label, frame, bench(frame, directory, runs))
+
+    finally:
+        shutil.rmtree(directory)
+
+    print('presets: %s' % ', '.join('%s=%s:%d' % (k, v[0], v[1]) for k, v in
+                                    sorted(compression.PRESETS.items())))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
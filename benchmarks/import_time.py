@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+#
+# Measures the cost of `import eoddata` and checks that the quote path never
+# pulls in the heavy dependencies.
+#
+#   python benchmarks/import_time.py [runs]
+
+import os
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ('scio', 'pandas', 'pytz', 'tzlocal')
+
+# NOTE The quote is served by a fake SOAP service so the benchmark exercises
+#      Client.quote's processing without touching the network or scio.
+PROBE = r'''
+import sys
+import time
+
+start = time.time()
+import eoddata
+import eoddata.datareader
+elapsed = time.time() - start
+
+
+class Obj(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class Service(object):
+    def QuoteGet(self, **kwargs):
+        quote = Obj(_Symbol_='MSFT', _Close_=42.0, _Volume_=1000)
+        return Obj(QuoteGetResult=Obj(Message='Success', QUOTE=quote))
+
+
+eoddata.ws.urllib2 = Obj(urlopen=lambda url: None)
+eoddata.ws.scio = Obj(Client=lambda wsdl: Obj(service=Service()))
+
+client = eoddata.Client('username', 'password')
+client.token = 'token'
+client.quote('NASDAQ', 'MSFT')
+
+print(repr((elapsed, [m for m in %r if m in sys.modules])))
+''' % (HEAVY,)
+
+
+def run(python, what):
+    output = subprocess.check_output([python, '-c', what], cwd=ROOT)
+    return eval(output.strip().splitlines()[-1])
+
+
+def main(runs=10):
+    timings = []
+    for _ in range(runs):
+        elapsed, loaded = run(sys.executable, PROBE)
+
+        if loaded:
+            raise SystemExit('quote path imported %s' % ', '.join(loaded))
+
+        timings.append(elapsed)
+
+    timings.sort()
+    print('import eoddata: best %.1fms, median %.1fms over %d runs' %
+          (timings[0] * 1000, timings[len(timings) // 2] * 1000, runs))
+    print('quote path imported none of: %s' % ', '.join(HEAVY))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
 
-from ws import Client, Error
+from ws import Client, Error, Timeout
 
-__all__ = ['Client', 'Error']
+__all__ = ['Client', 'Error', 'Timeout']
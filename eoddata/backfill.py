@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import collections
+import logging
+import os
+import threading
+import time
+from multiprocessing import pool
+
+import appdirs
+import datareader
+import lazy
+import ws
+
+pd = lazy.LazyModule('pandas')
+
+
+LOG = logging.getLogger(__name__)
+
+
+def default_journal(exchange, period, name='eoddata'):
+    return os.path.join(appdirs.user_cache_dir(name), 'backfill',
+                        '%s-period_%s.journal' % (exchange, period))
+
+
+def date_ranges(start, end, period='d'):
+    # NOTE Yearly units for daily and coarser bars, monthly for intraday
+    freq = 'MS' if str(period) in datareader._INTRADAY_PERIODS else 'AS'
+    start = pd.Timestamp(start).normalize()
+    end = pd.Timestamp(end).normalize()
+
+    bounds = [start] + [b for b in pd.date_range(start, end, freq=freq)
+                        if b > start]
+    ranges = []
+
+    for i, lower in enumerate(bounds):
+        upper = end
+        if i + 1 < len(bounds):
+            upper = bounds[i + 1] - pd.DateOffset(days=1)
+
+        ranges.append((lower.strftime('%Y-%m-%d'), upper.strftime('%Y-%m-%d')))
+
+    return ranges
+
+
+class Journal(object):
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+
+        path = os.path.dirname(filename)
+        if path and not os.path.exists(path):
+            os.makedirs(path)
+
+    def completed(self):
+        if not os.path.exists(self.filename):
+            return set()
+
+        with open(self.filename) as f:
+            # NOTE A torn last line from a crash is simply not a completed unit
+            return set(tuple(line.rstrip('\n').split('\t'))
+                       for line in f if line.endswith('\n'))
+
+    def record(self, unit):
+        with self.lock:
+            with open(self.filename, 'a') as f:
+                f.write('\t'.join(unit) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+
+class Backfill(object):
+    def __init__(self, manager, exchange, start, end=None, period='d',
+                 symbols=None, journal=None, workers=4, retries=5,
+                 backoff=2.0):
+        self.manager = manager
+        self.exchange = exchange
+        self.start = start
+        self.end = end if end is not None else pd.datetime.now()
+        self.period = period
+        self.symbols = symbols
+        self.journal = Journal(journal or default_journal(exchange, period))
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.failed = []
+
+    def units(self):
+        symbols = self.symbols
+        if symbols is None:
+            symbols = sorted(self.manager.symbols(self.exchange).columns)
+
+        ranges = date_ranges(self.start, self.end, self.period)
+        return [(symbol, lower, upper) for symbol in symbols
+                for lower, upper in ranges]
+
+    def pending(self):
+        completed = self.journal.completed()
+        return [unit for unit in self.units() if unit not in completed]
+
+    def _run_unit(self, unit):
+        symbol, lower, upper = unit
+
+        # NOTE A backfill is not demand, keep it out of the prewarm counts
+        kwargs = {}
+        if isinstance(self.manager, datareader.PickleCache):
+            kwargs['record'] = False
+
+        for attempt in range(self.retries + 1):
+            try:
+                self.manager.history(self.exchange, symbol, lower, upper,
+                                     self.period, **kwargs)
+
+            # NOTE EnvironmentError covers both IOError and the OSError a
+            #      failed rename raises
+            except (ws.Error, EnvironmentError) as e:
+                if attempt == self.retries:
+                    LOG.error("Giving up on %s:%s %s to %s: %s" %
+                              (self.exchange, symbol, lower, upper, e))
+                    self.failed.append(unit)
+                    return False
+
+                delay = self.backoff * 2 ** attempt
+                LOG.warning("Backfill of %s:%s %s to %s failed (%s), retrying "
+                            "in %.0fs" % (self.exchange, symbol, lower, upper,
+                                          e, delay))
+                time.sleep(delay)
+                continue
+
+            self.journal.record(unit)
+            return True
+
+    def _run_symbol(self, units):
+        return sum(self._run_unit(unit) for unit in units)
+
+    # NOTE Each worker owns a symbol and fills its ranges in order, so no two
+    #      threads ever extend the same cached history at once
+    def run(self):
+        pending = self.pending()
+        LOG.info("Backfilling %d units for %s period %s into %s" %
+                 (len(pending), self.exchange, self.period,
+                  self.journal.filename))
+
+        symbols = collections.OrderedDict()
+        for unit in pending:
+            symbols.setdefault(unit[0], []).append(unit)
+
+        workers = pool.ThreadPool(self.workers)
+        try:
+            done = sum(workers.imap_unordered(self._run_symbol,
+                                              symbols.values()))
+        finally:
+            workers.close()
+            workers.join()
+
+        LOG.info("Backfilled %d units, %d failed" % (done, len(self.failed)))
+        return done
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Resumable EODData history '
+                                                 'backfill')
+    parser.add_argument('exchange')
+    parser.add_argument('start')
+    parser.add_argument('end', nargs='?', default=None)
+    parser.add_argument('--period', default='d')
+    parser.add_argument('--symbols', default=None,
+                        help='comma separated symbols, defaults to the '
+                             'whole exchange')
+    parser.add_argument('--journal', default=None)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--directory', default=None,
+                        help='PickleCache directory')
+    parser.add_argument('--username',
+                        default=os.environ.get('EODDATA_USERNAME'))
+    parser.add_argument('--password',
+                        default=os.environ.get('EODDATA_PASSWORD'))
+    args = parser.parse_args(argv)
+
+    if not args.username or not args.password:
+        parser.error('--username and --password (or EODDATA_USERNAME and '
+                     'EODDATA_PASSWORD) are required')
+
+    logging.basicConfig(level=logging.INFO)
+
+    symbols = None
+    if args.symbols:
+        symbols = args.symbols.split(',')
+
+    client = ws.Client(args.username, args.password)
+    cache = datareader.PickleCache(client, directory=args.directory)
+
+    try:
+        Backfill(cache, args.exchange, args.start, args.end, args.period,
+                 symbols=symbols, journal=args.journal,
+                 workers=args.workers).run()
+
+    finally:
+        cache.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+import bz2
+import os
+import tempfile
+import zlib
+
+import cPickle as pickle
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+
+MAGIC = 'EODC:'
+
+
+def _identity(data, level=None):
+    return data
+
+
+# NOTE codec: (compress(data, level), decompress(data), default level)
+CODECS = {'none': (_identity, _identity, 0),
+          'zlib': (zlib.compress, zlib.decompress, 6),
+          'bz2': (bz2.compress, bz2.decompress, 9)}
+
+if lzma is not None:
+    CODECS['lzma'] = (lambda data, level: lzma.compress(data, preset=level),
+                      lzma.decompress, 6)
+
+PRESETS = {'fast': ('zlib', 1),
+           'balanced': ('zlib', 6),
+           'small': ('bz2', 9)}
+
+if lzma is not None:
+    PRESETS['smallest'] = ('lzma', 9)
+
+
+def resolve(codec=None, level=None):
+    if codec is None:
+        codec = 'none'
+
+    if codec in PRESETS:
+        preset_codec, preset_level = PRESETS[codec]
+        return preset_codec, preset_level if level is None else level
+
+    if codec not in CODECS:
+        raise ValueError("Unknown compression codec %r, expected one of %s" %
+                         (codec, ', '.join(sorted(CODECS) + sorted(PRESETS))))
+
+    if level is None:
+        level = CODECS[codec][2]
+
+    return codec, level
+
+
+def dumps(obj, codec=None, level=None):
+    codec, level = resolve(codec, level)
+    data = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+
+    if codec == 'none':
+        return data
+
+    header = '%s%s:%d\n' % (MAGIC, codec, level)
+    return header + CODECS[codec][0](data, level)
+
+
+def codec(data):
+    if not data.startswith(MAGIC):
+        return None
+
+    return data[len(MAGIC):data.index('\n')].split(':')[0]
+
+
+def loads(data):
+    name = codec(data)
+
+    if name is None:
+        return pickle.loads(data)
+
+    if name not in CODECS:
+        raise ValueError("Cache entry compressed with unavailable codec %r" %
+                         name)
+
+    data = data[data.index('\n') + 1:]
+    return pickle.loads(CODECS[name][1](data))
+
+
+def dump(obj, filename, codec=None, level=None):
+    data = dumps(obj, codec, level)
+
+    # NOTE A unique temporary name, writers racing on the same file must not
+    #      rename each other's half written data into place
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(filename) + '.',
+                               suffix='.tmp',
+                               dir=os.path.dirname(filename) or '.')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+
+    os.rename(tmp, filename)
+    return len(data)
+
+
+def load(filename, legacy=None):
+    with open(filename, 'rb') as f:
+        data = f.read()
+
+    # NOTE Uncompressed entries are plain pickles. They are unpickled from
+    #      the bytes already read, only ones an older version wrote that
+    #      plain pickle can't decode go to the caller's loader, which reads
+    #      the file again.
+    if legacy is not None and codec(data) is None:
+        try:
+            return pickle.loads(data)
+
+        except Exception:
+            return legacy(filename)
+
+    return loads(data)
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import collections
+import logging
+import os
+import threading
+import time
+from multiprocessing import managers
+
+import appdirs
+import datareader
+import ws
+
+
+LOG = logging.getLogger(__name__)
+
+METHODS = ('exchanges', 'exchange_tz', 'symbols', 'history', 'fundamentals',
+           'technicals')
+
+
+def default_address(name='eoddata'):
+    return os.path.join(appdirs.user_cache_dir(name), 'daemon.sock')
+
+
+def authkey_file(address):
+    return '.'.join((address, 'key'))
+
+
+def read_authkey(address):
+    with open(authkey_file(address), 'rb') as f:
+        return f.read()
+
+
+def write_authkey(address):
+    filename = authkey_file(address)
+    fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+
+    with os.fdopen(fd, 'wb') as f:
+        f.write(os.urandom(32))
+
+    return read_authkey(address)
+
+
+class Flight(object):
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+# NOTE Lives in the daemon and is shared by every connected process. Results
+#      are memoized in memory for `ttl` seconds (bounded to `max_entries`
+#      with LRU eviction), and concurrent misses for the same call wait on
+#      the one request that is already in flight instead of duplicating it.
+#      Misses for different calls are serialized, the datasource and its
+#      client are not safe to drive from several connections at once.
+class CacheService(object):
+    def __init__(self, datasource, ttl=300, max_entries=1024):
+        self.datasource = datasource
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._source_lock = threading.Lock()
+        self._memo = collections.OrderedDict()
+        self._flights = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(method, args, kwargs):
+        return (method, args, tuple(sorted(kwargs.items())))
+
+    def _cached(self, key):
+        entry = self._memo.pop(key, None)
+
+        if entry is None:
+            return None
+
+        if time.time() - entry[0] >= self.ttl:
+            return None
+
+        self._memo[key] = entry
+        return entry
+
+    def _store(self, key, result):
+        self._memo.pop(key, None)
+        self._memo[key] = (time.time(), result)
+
+        while len(self._memo) > self.max_entries:
+            self._memo.popitem(last=False)
+
+    def call(self, method, *args, **kwargs):
+        if method not in METHODS:
+            raise AttributeError(method)
+
+        key = self._key(method, args, kwargs)
+
+        with self._lock:
+            entry = self._cached(key)
+
+            if entry is not None:
+                self.hits += 1
+                return entry[1]
+
+            self.misses += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+
+            if leader:
+                flight = self._flights[key] = Flight()
+
+        if not leader:
+            flight.event.wait()
+
+            if flight.error is not None:
+                raise flight.error
+
+            return flight.result
+
+        try:
+            with self._source_lock:
+                flight.result = getattr(self.datasource, method)(*args,
+                                                                 **kwargs)
+
+        except Exception as e:
+            flight.error = e
+            raise
+
+        finally:
+            with self._lock:
+                if flight.error is None:
+                    self._store(key, flight.result)
+
+                del self._flights[key]
+
+            flight.event.set()
+
+        return flight.result
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'entries': len(self._memo),
+                    'in_flight': len(self._flights)}
+
+    def clear(self):
+        with self._lock:
+            self._memo.clear()
+
+
+class CacheServer(managers.BaseManager):
+    pass
+
+
+class CacheClient(managers.BaseManager):
+    pass
+
+
+CacheClient.register('service')
+
+
+def serve(datasource, address=None, authkey=None, **kwargs):
+    if address is None:
+        address = default_address()
+
+    if authkey is None:
+        authkey = write_authkey(address)
+
+    if isinstance(address, basestring) and os.path.exists(address):
+        os.unlink(address)
+
+    service = CacheService(datasource, **kwargs)
+    CacheServer.register('service', callable=lambda: service)
+
+    LOG.info("Serving EODData cache on %s" % (address,))
+    server = CacheServer(address=address, authkey=authkey).get_server()
+    server.serve_forever()
+
+
+class RemoteManager(datareader.Manager):
+    def __init__(self, address=None, authkey=None):
+        datareader.Manager.__init__(self, None)
+
+        if address is None:
+            address = default_address()
+
+        if authkey is None:
+            authkey = read_authkey(address)
+
+        self.manager = CacheClient(address=address, authkey=authkey)
+        self.manager.connect()
+        self.service = self.manager.service()
+
+    def exchanges(self, expiration='1d'):
+        return self.service.call('exchanges', expiration=expiration)
+
+    def exchange_tz(self, exchange, exchanges=None):
+        return self.service.call('exchange_tz', exchange)
+
+    def symbols(self, exchange, expiration='1d'):
+        return self.service.call('symbols', exchange, expiration=expiration)
+
+    def fundamentals(self, exchange, expiration='1d'):
+        return self.service.call('fundamentals', exchange,
+                                 expiration=expiration)
+
+    def technicals(self, exchange, expiration='1d'):
+        return self.service.call('technicals', exchange,
+                                 expiration=expiration)
+
+    def history(self, exchange, symbol, start, end=None, period='d'):
+        return self.service.call('history', exchange, symbol, start, end,
+                                 period)
+
+    def stats(self):
+        return self.service.stats()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Node-local EODData cache '
+                                                 'daemon')
+    parser.add_argument('--username',
+                        default=os.environ.get('EODDATA_USERNAME'))
+    parser.add_argument('--password',
+                        default=os.environ.get('EODDATA_PASSWORD'))
+    parser.add_argument('--address', default=None,
+                        help='unix socket path (default: daemon.sock in the '
+                             'user cache directory)')
+    parser.add_argument('--directory', default=None,
+                        help='PickleCache directory')
+    parser.add_argument('--ttl', type=int, default=300,
+                        help='seconds results stay in memory')
+    parser.add_argument('--max-entries', type=int, default=1024)
+    args = parser.parse_args(argv)
+
+    if not args.username or not args.password:
+        parser.error('--username and --password (or EODDATA_USERNAME and '
+                     'EODDATA_PASSWORD) are required')
+
+    logging.basicConfig(level=logging.INFO)
+
+    client = ws.Client(args.username, args.password)
+    datasource = datareader.PickleCache(client, directory=args.directory)
+    serve(datasource, address=args.address, ttl=args.ttl,
+          max_entries=args.max_entries)
+
+
+if __name__ == '__main__':
+    main()
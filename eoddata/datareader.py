@@ -1,15 +1,28 @@
 # -*- coding: utf-8 -*-
 
+import atexit
+import collections
+import contextlib
+import datetime
+import errno
+import multiprocessing
 import os
 import logging
-
-import pandas as pd
-import pytz
-from tzlocal import windows_tz
+import sqlite3
+import threading
+import time
 
 import appdirs
+import compression
+import lazy
+import snapshot
 import ws
 
+np = lazy.LazyModule('numpy')
+pd = lazy.LazyModule('pandas')
+pytz = lazy.LazyModule('pytz')
+windows_tz = lazy.LazyModule('tzlocal.windows_tz')
+
 
 LOG = logging.getLogger(__name__)
 
@@ -20,6 +33,25 @@ _TYPE_MAP = {'integer': int,
              'boolean': bool,
              'datetime': 'M8[ns]'}
 
+# NOTE Periods that are exact aggregations of a finer cached period
+_DERIVED_PERIODS = {'w': 'd', 'm': 'd', 'q': 'd', 'y': 'd',
+                    '5': '1', '10': '1', '15': '1', '30': '1', 'h': '1'}
+
+_INTRADAY_PERIODS = ('1', '5', '10', '15', '30', 'h')
+
+_RESAMPLE_RULES = {'w': 'W-FRI', 'm': 'M', 'q': 'Q', 'y': 'A',
+                   '5': '5min', '10': '10min', '15': '15min', '30': '30min',
+                   'h': 'H'}
+
+# NOTE Prices are quoted to at most 4 decimals, float32 is only used when it
+#      round trips within that
+_PRICE_TOLERANCE = 5e-5
+
+_COUNT_COLUMNS = ('volume', 'open_interest')
+
+_AGGREGATIONS = {'open': 'first', 'high': 'max', 'low': 'min',
+                 'close': 'last', 'volume': 'sum'}
+
 
 def file_name(name, format):
     return '.'.join((name, format))
@@ -60,9 +92,272 @@ def timetastic(ts, tz=None):
     return ts
 
 
+def to_seconds(offset):
+    return pd.core.datetools.to_offset(offset).delta.total_seconds()
+
+
+def read_cache(filename):
+    return compression.load(filename, legacy=pd.read_pickle)
+
+
+def is_missing(error):
+    return getattr(error, 'errno', None) == errno.ENOENT
+
+
+def resample_history(history, period):
+    period = str(period)
+    how = dict([(col, _AGGREGATIONS.get(col, 'last'))
+                for col in history.columns])
+
+    # NOTE Intraday bars keep the bucket start, coarser bars are dated on the
+    #      last trading day they cover rather than a calendar boundary. That
+    #      date travels through the aggregation as int64 nanoseconds, a tz
+    #      aware column would lose its timezone on the way.
+    intraday = period in _INTRADAY_PERIODS
+    if not intraday:
+        history = history.copy()
+        history['_date_time'] = history.index.asi8
+        how['_date_time'] = 'last'
+
+    bars = history.resample(_RESAMPLE_RULES[period], how=how)
+
+    if intraday:
+        bars = bars.dropna(how='all')
+
+    else:
+        bars = bars[bars['_date_time'].notnull()]
+        index = pd.DatetimeIndex(bars['_date_time'].values.astype('int64'))
+
+        if history.index.tz is not None:
+            index = index.tz_localize('UTC').tz_convert(history.index.tz)
+
+        bars.index = index
+
+    bars.index.name = history.index.name
+    return bars[[col for col in history.columns if col != '_date_time']]
+
+
+def bucket_bounds(period, start, end):
+    period = str(period)
+
+    # NOTE Intraday buckets never cross a day, whole days are enough
+    if period in _INTRADAY_PERIODS:
+        return start, end
+
+    offset = pd.core.datetools.to_offset(_RESAMPLE_RULES[period])
+    first = pd.Timestamp(start.date())
+    last = offset.rollforward(pd.Timestamp(end.date()))
+    first = offset.rollforward(first) - offset + pd.DateOffset(days=1)
+    return timetastic(first, start.tz), timetastic(last, end.tz)
+
+
+def slice_history(history, start, end=None):
+    if end is None:
+        return history.ix[start:]
+
+    # NOTE(jkoelker) String date indexing allows any time on the date
+    return history.ix[str(start):str(end.date())]
+
+
+# NOTE Spans are inclusive (first, last) date pairs, days next to each other
+#      merge into one span
+def merge_spans(spans):
+    merged = []
+
+    for lower, upper in sorted(spans):
+        if merged and lower <= merged[-1][1] + datetime.timedelta(days=1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], upper))
+
+        else:
+            merged.append((lower, upper))
+
+    return merged
+
+
+def subtract_span(spans, lower, upper):
+    remaining = []
+
+    for first, last in spans:
+        if last < lower or first > upper:
+            remaining.append((first, last))
+            continue
+
+        if first < lower:
+            remaining.append((first, lower - datetime.timedelta(days=1)))
+
+        if last > upper:
+            remaining.append((upper + datetime.timedelta(days=1), last))
+
+    return remaining
+
+
+def gaps(spans, lower, upper):
+    missing = []
+
+    for first, last in merge_spans(spans):
+        if lower > upper or first > upper:
+            break
+
+        if last < lower:
+            continue
+
+        if first > lower:
+            missing.append((lower, first - datetime.timedelta(days=1)))
+
+        lower = last + datetime.timedelta(days=1)
+
+    if lower <= upper:
+        missing.append((lower, upper))
+
+    return missing
+
+
+def shard_span(shard):
+    year = int(shard[:4])
+
+    if len(shard) == 4:
+        return datetime.date(year, 1, 1), datetime.date(year, 12, 31)
+
+    month = int(shard[4:])
+    following = datetime.date(year + month // 12, month % 12 + 1, 1)
+    return (datetime.date(year, month, 1),
+            following - datetime.timedelta(days=1))
+
+
+# NOTE Workers hand back the index as int64 nanoseconds plus one contiguous
+#      array per column, which pickles as raw buffers instead of the
+#      per-object encoding a DataFrame goes through. The buffers are still
+#      copied through the pool's pipe. A shared memory handoff
+#      (sharedctypes.RawArray, or an np.save memmap in /dev/shm) would
+#      avoid that copy but need per-call sizing and cleanup, and the parent
+#      copies every frame once more when it concatenates them.
+def pack_history(history):
+    return (history.index.asi8, str(history.index.tz),
+            list(history.columns),
+            [history[col].values for col in history.columns])
+
+
+def unpack_history(packed):
+    index, tz, columns, values = packed
+    index = pd.DatetimeIndex(index).tz_localize('UTC')
+
+    if tz != 'None':
+        index = index.tz_convert(tz)
+
+    return pd.DataFrame(dict(zip(columns, values)), index=index,
+                        columns=columns)
+
+
+def upgrade_manifest(manifest):
+    # NOTE Manifests written before coverage was tracked only list shards,
+    #      their bounds stand in for the covered spans
+    if 'shards' in manifest:
+        return manifest
+
+    return {'shards': manifest,
+            'covered': merge_spans((first.date(), last.date())
+                                   for first, last, _
+                                   in manifest.itervalues())}
+
+
+# NOTE Runs in a pool worker, which reads the manifest itself so the parent
+#      doesn't load them one after another. A history that doesn't cover the
+#      whole window, or whose files went missing, is handed back as None
+#      for the parent to fetch through _cached_history.
+def _load_history(args):
+    base, start, end, search_end, exchange_end = args
+
+    try:
+        manifest = upgrade_manifest(read_cache('/'.join((base,
+                                                         'manifest.pkl'))))
+
+        if gaps(manifest['covered'], start.date(),
+                min(search_end, exchange_end).date()):
+            return None
+
+        filenames = ['.'.join(('/'.join((base, shard)), 'pkl')) for shard
+                     in PickleCache._shards(manifest, start, search_end)]
+
+        if not filenames:
+            return None
+
+        history = pd.concat([read_cache(f) for f in filenames])
+
+    except EnvironmentError as e:
+        if not is_missing(e):
+            raise
+
+        return None
+
+    return filenames, pack_history(slice_history(history, start, end))
+
+
+def memory_usage(frame):
+    return int(frame.memory_usage(index=True, deep=True).sum())
+
+
+def _smallest_int(values):
+    for dtype in ('int8', 'int16', 'int32', 'int64'):
+        info = np.iinfo(dtype)
+        if values.min() >= info.min and values.max() <= info.max:
+            return dtype
+
+
+def compact_frame(frame, price_tolerance=_PRICE_TOLERANCE):
+    if frame.empty:
+        return frame
+
+    frame = frame.copy()
+
+    for col in frame.columns:
+        values = frame[col]
+
+        if values.dtype == np.float64:
+            if (col in _COUNT_COLUMNS and values.notnull().all() and
+                    (values == values.round()).all()):
+                frame[col] = values.astype(_smallest_int(values))
+                continue
+
+            narrow = values.astype(np.float32)
+            if ((narrow.astype(np.float64) - values).abs().fillna(0) <=
+                    price_tolerance).all():
+                frame[col] = narrow
+
+        elif values.dtype.kind in 'iu':
+            frame[col] = values.astype(_smallest_int(values))
+
+        elif values.dtype.kind == 'M':
+            frame[col] = values.values.view('int64')
+
+        elif values.dtype == object and values.nunique() <= len(values) // 2:
+            frame[col] = values.astype('category')
+
+    if isinstance(frame.index, pd.DatetimeIndex):
+        frame.index = pd.Index(frame.index.asi8, name=frame.index.name)
+
+    elif isinstance(frame.index, pd.MultiIndex):
+        frame.index = frame.index.set_levels(
+            [pd.Index(level.asi8, name=level.name)
+             if isinstance(level, pd.DatetimeIndex) else level
+             for level in frame.index.levels])
+
+    return frame
+
+
 class Manager(object):
-    def __init__(self, client):
+    def __init__(self, client, compact=False):
         self.client = client
+        self.compact = compact
+
+    def _compact(self, frame):
+        if not self.compact:
+            return frame
+
+        before = memory_usage(frame)
+        frame = compact_frame(frame)
+        LOG.debug("Compacted frame from %d to %d bytes" %
+                  (before, memory_usage(frame)))
+        return frame
 
     def _last_trade_date(self, exchange, expiration='1d'):
         exchanges = self.exchanges(expiration=expiration)
@@ -89,7 +384,19 @@ class Manager(object):
         LOG.info("Getting Symbols for exchange %s" % exchange)
         return pd.DataFrame(self.client.symbols(exchange))
 
+    def fundamentals(self, exchange, expiration='1d'):
+        LOG.info("Getting Fundamentals for exchange %s" % exchange)
+        return pd.DataFrame(self.client.fundamentals(exchange))
+
+    def technicals(self, exchange, expiration='1d'):
+        LOG.info("Getting Technicals for exchange %s" % exchange)
+        return pd.DataFrame(self.client.technicals(exchange))
+
     def history(self, exchange, symbol, start, end=None, period='d'):
+        return self._compact(self._fetch_history(exchange, symbol, start, end,
+                                                 period))
+
+    def _fetch_history(self, exchange, symbol, start, end=None, period='d'):
         symbols = self.symbols(exchange)
 
         if symbol not in symbols:
@@ -130,8 +437,10 @@ class Manager(object):
 
 class CacheManager(Manager):
     def __init__(self, client, directory=None, name='eoddata',
-                 *args, **kwargs):
-        Manager.__init__(self, client)
+                 codec=None, codec_level=None, compact=False, *args, **kwargs):
+        Manager.__init__(self, client, compact)
+
+        self.codec, self.codec_level = compression.resolve(codec, codec_level)
 
         if directory is None:
             directory = appdirs.user_cache_dir(name)
@@ -141,8 +450,80 @@ class CacheManager(Manager):
         if not os.path.exists(self.directory):
             os.makedirs(self.directory)
 
+        self.snapshots = snapshot.SnapshotStore(os.path.join(self.directory,
+                                                             'snapshots'))
+        self.symbol_master = snapshot.SymbolMaster(os.path.join(self.directory,
+                                                                'master'))
+
+    @staticmethod
+    def _is_fresh(mtime, expiration=None):
+        if mtime is None:
+            return False
+
+        if expiration is None:
+            return True
 
+        # NOTE mtimes are epoch seconds, compare them against time.time()
+        #      rather than naive local datetimes
+        return time.time() - mtime < to_seconds(expiration)
+
+
+# NOTE Entries are tracked in an index (size, fetch time, ttl, last access)
+#      so freshness checks don't stat the filesystem and `max_bytes` can be
+#      enforced by evicting the least recently used entries. Files missing
+#      from the index, e.g. written by another process, fall back to a stat,
+#      and files another process removed are treated as a miss. The index is
+#      saved every `flush_every` changes or `flush_interval` seconds, merged
+#      into the one on disk so processes sharing the directory keep each
+#      other's entries, and once more at exit. Evictable entries are also
+#      kept in access order so eviction pops the oldest without sorting, and
+#      shards of a history being read or extended are never evicted under
+#      it.
+#      The index, access log and negative entries are guarded by one lock,
+#      each cached history by its own lock held while it is read and
+#      extended, so threads only wait on each other for the same symbol.
 class PickleCache(CacheManager):
+    def __init__(self, client, directory=None, name='eoddata', max_bytes=None,
+                 negative_ttl='1d', negative_recent_ttl='15min',
+                 flush_every=100, flush_interval=30, *args, **kwargs):
+        CacheManager.__init__(self, client, directory, name, *args, **kwargs)
+
+        self.max_bytes = max_bytes
+        self.negative_ttl = negative_ttl
+        self.negative_recent_ttl = negative_recent_ttl
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.negative_hits = 0
+        self._dirs = set()
+        self._lock = threading.RLock()
+        self._key_locks = {}
+        self._pinned = collections.defaultdict(int)
+        self._index_file = os.path.join(self.directory, 'index.pkl')
+        self._access_file = os.path.join(self.directory, 'access.pkl')
+        self._negative_file = os.path.join(self.directory, 'negative.pkl')
+        self.index = self._load(self._index_file)
+        self.access = self._load(self._access_file)
+        self._accesses = {}
+        self.negative = self._load(self._negative_file)
+        self._bytes = sum(entry['size'] for entry in self.index.values())
+        self._lru = self._lru_order(self.index)
+        self._dirty = set()
+        self._removed = set()
+        self._changes = 0
+        self._flushed = time.time()
+
+        atexit.register(self.close)
+
+    @staticmethod
+    def _load(filename):
+        if not os.path.exists(filename):
+            return {}
+
+        return compression.load(filename)
+
     @staticmethod
     def _get_key(*parts):
         return '/'.join(parts)
@@ -152,24 +533,318 @@ class PickleCache(CacheManager):
 
         if create:
             path = os.path.dirname(filename)
-            if not os.path.exists(path):
-                os.makedirs(path)
+            if path not in self._dirs:
+                if not os.path.exists(path):
+                    os.makedirs(path)
+
+                self._dirs.add(path)
 
         return filename
 
-    def _can_haz_cache(self, key, expiration=None):
-        filename = self._get_file(key)
-        if not os.path.exists(filename):
-            return False
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.RLock())
 
-        if expiration is None:
+    @contextlib.contextmanager
+    def _holding(self, key):
+        prefix = '/'.join((self.directory, key, ''))
+
+        with self._key_lock(key):
+            with self._lock:
+                self._pinned[prefix] += 1
+
+            try:
+                yield
+
+            finally:
+                with self._lock:
+                    self._pinned[prefix] -= 1
+                    if not self._pinned[prefix]:
+                        del self._pinned[prefix]
+
+    @staticmethod
+    def _lru_order(index):
+        return collections.OrderedDict(
+            (filename, None) for _, filename in
+            sorted((entry['accessed'], filename)
+                   for filename, entry in index.iteritems()
+                   if entry.get('evictable', True)))
+
+    def _touch(self, filename, entry):
+        self._lru.pop(filename, None)
+
+        if entry.get('evictable', True):
+            self._lru[filename] = None
+
+    def _entry(self, filename):
+        with self._lock:
+            entry = self.index.get(filename)
+
+            if entry is None and os.path.exists(filename):
+                mtime = os.path.getmtime(filename)
+                entry = self.index[filename] = {
+                    'size': os.path.getsize(filename), 'fetched': mtime,
+                    'accessed': mtime, 'ttl': None}
+                self._bytes += entry['size']
+                self._dirty.add(filename)
+                self._touch(filename, entry)
+
+            return entry
+
+    def _exists(self, filename):
+        return self._entry(filename) is not None
+
+    # NOTE Returns None when another process removed the file
+    def _read(self, filename):
+        with self._lock:
+            entry = self._entry(filename)
+
+            if entry is not None:
+                entry['accessed'] = time.time()
+                self._dirty.add(filename)
+                self._touch(filename, entry)
+
+        try:
+            return read_cache(filename)
+
+        except EnvironmentError as e:
+            if not is_missing(e):
+                raise
+
+            LOG.info("%s was removed from the cache" % filename)
+            self._forget(filename)
+            return None
+
+    def _write(self, obj, filename, evict=True, **meta):
+        size = compression.dump(obj, filename, self.codec, self.codec_level)
+
+        with self._lock:
+            now = time.time()
+            entry = self.index.setdefault(filename, {'ttl': None, 'size': 0})
+            self._bytes += size - entry['size']
+            entry.update(meta)
+            entry.update({'size': size, 'fetched': now, 'accessed': now})
+            self._touch(filename, entry)
+            self._dirty.add(filename)
+            self._removed.discard(filename)
+            self._changes += 1
+
+            if evict:
+                self._evict()
+                self._flush()
+
+        return size
+
+    def _forget(self, filename):
+        with self._lock:
+            entry = self.index.pop(filename, None)
+
+            if entry is not None:
+                self._bytes -= entry['size']
+
+            self._lru.pop(filename, None)
+            self._dirty.discard(filename)
+            self._removed.add(filename)
+            self._changes += 1
+
+    def _remove(self, filename):
+        self._forget(filename)
+
+        try:
+            os.unlink(filename)
+
+        except EnvironmentError as e:
+            if not is_missing(e):
+                raise
+
+    def _flush(self, force=False):
+        with self._lock:
+            if (not force and self._changes < self.flush_every and
+                    time.time() - self._flushed < self.flush_interval):
+                return
+
+            self._save()
+
+    # NOTE Other processes may have saved since this one loaded, only the
+    #      entries this process changed replace theirs
+    def _save(self):
+        index = self._load(self._index_file)
+        for filename in self._removed:
+            index.pop(filename, None)
+
+        for filename in self._dirty:
+            if filename in self.index:
+                index[filename] = self.index[filename]
+
+        negative = self._load(self._negative_file)
+        negative.update(self.negative)
+
+        # NOTE Access counts are summed with the ones other processes saved
+        access = self._load(self._access_file)
+        for key, entry in self._accesses.iteritems():
+            self._merge_access(access, key, entry['count'], entry['accessed'],
+                               entry['start'], entry['end'])
+
+        self.index = index
+        self.access = access
+        self.negative = dict([(key, entry)
+                              for key, entry in negative.iteritems()
+                              if self._is_fresh(entry[0], entry[1])])
+        self._bytes = sum(entry['size'] for entry in self.index.values())
+        self._lru = self._lru_order(self.index)
+
+        compression.dump(self.index, self._index_file)
+        compression.dump(self.access, self._access_file)
+        compression.dump(self.negative, self._negative_file)
+
+        self._dirty.clear()
+        self._removed.clear()
+        self._accesses.clear()
+        self._changes = 0
+        self._flushed = time.time()
+
+    # NOTE Negative entries remember unknown symbols and windows EODData
+    #      confirmed to be empty. Windows reaching the exchange's last trade
+    #      date may still fill in, so they expire after the shorter
+    #      `negative_recent_ttl`.
+    def _is_negative(self, key):
+        with self._lock:
+            entry = self.negative.get(key)
+
+            if entry is None:
+                return False
+
+            if not self._is_fresh(entry[0], entry[1]):
+                self.negative.pop(key, None)
+                return False
+
+            self.negative_hits += 1
             return True
 
-        mtime = pd.to_datetime(os.path.getmtime(filename), unit='s')
-        expiration = pd.core.datetools.to_offset(expiration)
-        if (pd.datetime.now() - mtime) < expiration.delta:
+    def _set_negative(self, key, ttl):
+        with self._lock:
+            self.negative[key] = (time.time(), ttl)
+            self._changes += 1
+            self._flush()
+
+    @staticmethod
+    def _merge_access(access, key, count, accessed, start, end):
+        entry = access.setdefault(key, {'count': 0, 'accessed': accessed,
+                                        'start': start, 'end': end})
+        entry['count'] += count
+        entry['accessed'] = max(entry['accessed'], accessed)
+
+        if start < entry['start']:
+            entry['start'] = start
+
+        # NOTE An open ended request wins, it always wants the latest bars
+        if end is None or (entry['end'] is not None and end > entry['end']):
+            entry['end'] = end
+
+    # NOTE Accesses since the last save are also kept apart, they are what
+    #      gets added to the counts on disk
+    def _record_access(self, exchange, symbol, period, start, end):
+        key = (exchange, symbol, str(period))
+
+        with self._lock:
+            now = time.time()
+            for access in (self.access, self._accesses):
+                self._merge_access(access, key, 1, now, start, end)
+
+            self._changes += 1
+
+    def hottest(self, n=None, since='7d'):
+        cutoff = None
+        if since is not None:
+            cutoff = time.time() - to_seconds(since)
+
+        # NOTE Saving merges in the counts other processes saved since this
+        #      one last loaded them, a long running prewarm would otherwise
+        #      rank stale counts
+        self._flush(force=True)
+
+        with self._lock:
+            entries = [(key, dict(entry))
+                       for key, entry in self.access.items()
+                       if cutoff is None or entry['accessed'] >= cutoff]
+        entries.sort(key=lambda i: (i[1]['count'], i[1]['accessed']),
+                     reverse=True)
+        return entries[:n] if n is not None else entries
+
+    def prewarm(self, n=None, budget=None, since='7d'):
+        misses = self.misses
+        warmed = []
+
+        for (exchange, symbol, period), entry in self.hottest(n, since):
+            if budget is not None and self.misses - misses >= budget:
+                LOG.info("Prewarm request budget of %s exhausted" % budget)
+                break
+
+            LOG.info("Prewarming %s:%s period %s" % (exchange, symbol, period))
+
+            # NOTE Warming the cache is not an access
+            try:
+                self.history(exchange, symbol, entry['start'], entry['end'],
+                             period, record=False)
+
+            except ws.Error as e:
+                LOG.warning("Prewarm of %s:%s failed: %s" % (exchange, symbol,
+                                                             e))
+                continue
+
+            warmed.append((exchange, symbol, period))
+
+        self._flush(force=True)
+        return warmed
+
+    # NOTE Evicting a shard only removes its file, the manifest that lists it
+    #      belongs to another history's lock and drops the shard the next time
+    #      it is read
+    def _evict(self):
+        if self.max_bytes is None:
+            return
+
+        with self._lock:
+            excess = self._bytes - self.max_bytes
+            victims = []
+
+            for filename in self._lru:
+                if excess <= 0:
+                    break
+
+                if any(filename.startswith(prefix) for prefix in self._pinned):
+                    continue
+
+                victims.append(filename)
+                excess -= self.index[filename]['size']
+
+            for filename in victims:
+                LOG.info("Evicting %s from cache" % filename)
+                self._remove(filename)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'negative_hits': self.negative_hits,
+                    'negative_entries': len(self.negative),
+                    'entries': len(self.index),
+                    'bytes': self._bytes,
+                    'max_bytes': self.max_bytes}
+
+    def close(self, *args, **kwargs):
+        self._flush(force=True)
+
+    def _can_haz_cache(self, key, expiration=None):
+        entry = self._entry(self._get_file(key))
+
+        if entry is not None and self._is_fresh(entry['fetched'], expiration):
+            self.hits += 1
             return True
 
+        self.misses += 1
         return False
 
     def exchanges(self, expiration='1d'):
@@ -177,96 +852,642 @@ class PickleCache(CacheManager):
         filename = self._get_file(key)
 
         if self._can_haz_cache(key, expiration):
-            return pd.read_pickle(filename)
+            exchanges = self._read(filename)
+
+            if exchanges is not None:
+                return exchanges
 
         exchanges = CacheManager.exchanges(self, expiration)
-        exchanges.to_pickle(filename)
+        self._write(exchanges, filename, ttl=expiration)
         return exchanges
 
-    # TODO(jkoelker) handle rename/delisting and the like
     def symbols(self, exchange, expiration='1d'):
         key = self._get_key('symbols', exchange)
         filename = self._get_file(key)
 
         if self._can_haz_cache(key, expiration):
-            return pd.read_pickle(filename)
+            symbols = self._read(filename)
+
+            if symbols is not None:
+                return symbols
 
         symbols = CacheManager.symbols(self, exchange, expiration)
-        symbols.to_pickle(filename)
+        self.symbol_master.refresh(exchange, symbols.to_dict())
+        self._write(symbols, filename, ttl=expiration)
         return symbols
 
+    def symbol_changes(self, exchange, since):
+        return self.symbol_master.changes_since(exchange, since)
+
+    def symbols_changed_since(self, exchange, since):
+        return self.symbol_master.changed_since(exchange, since)
+
+    def _snapshot(self, kind, exchange, date=None, expiration='1d'):
+        if date is not None:
+            return pd.DataFrame(self.snapshots.load(kind, exchange, date))
+
+        if self._is_fresh(self.snapshots.mtime(kind, exchange), expiration):
+            return pd.DataFrame(self.snapshots.load(kind, exchange))
+
+        LOG.info("Getting %s for exchange %s" % (kind.title(), exchange))
+        data = getattr(self.client, kind)(exchange)
+        self.snapshots.save(kind, exchange, data)
+        return pd.DataFrame(data)
+
+    def fundamentals(self, exchange, expiration='1d', date=None):
+        return self._snapshot('fundamentals', exchange, date, expiration)
+
+    def technicals(self, exchange, expiration='1d', date=None):
+        return self._snapshot('technicals', exchange, date, expiration)
+
+    def fundamentals_changed_since(self, exchange, since, date=None):
+        return pd.DataFrame(self.snapshots.changed_since('fundamentals',
+                                                         exchange, since,
+                                                         date))
+
+    def technicals_changed_since(self, exchange, since, date=None):
+        return pd.DataFrame(self.snapshots.changed_since('technicals',
+                                                         exchange, since,
+                                                         date))
+
     def _history(self, exchange, symbol, start, end=None, period='d'):
-        return CacheManager.history(self, exchange, symbol, start, end, period)
+        key = ('range', exchange, symbol, str(period), str(start.date()),
+               str(end.date()) if end is not None else None)
 
-    def history(self, exchange, symbol, start, end=None, period='d'):
-        tz = self.exchange_tz(exchange)
+        if self._is_negative(key):
+            return pd.DataFrame()
+
+        self.misses += 1
+        history = CacheManager._fetch_history(self, exchange, symbol, start, end,
+                                              period)
+
+        if history.empty:
+            ttl = self.negative_ttl
+            exchange_end = self._last_trade_date(exchange)
+
+            if end is None or end.date() >= exchange_end.date():
+                ttl = self.negative_recent_ttl
+
+            self._set_negative(key, ttl)
+
+        return history
+
+    @staticmethod
+    def _shard_names(period, index):
+        # NOTE Daily and coarser bars are sharded per year, intraday bars
+        #      per month
+        if str(period) in _INTRADAY_PERIODS:
+            return ['%04d%02d' % (y, m) for y, m in zip(index.year,
+                                                        index.month)]
+
+        return ['%04d' % y for y in index.year]
+
+    def _manifest_file(self, key):
+        return self._get_file(self._get_key(key, 'manifest'))
+
+    def _shard_file(self, key, shard, create=True):
+        return self._get_file(self._get_key(key, shard), create=create)
+
+    # NOTE A manifest lists the shards of a history and the date spans that
+    #      were fetched, so a gap left by an eviction or a disjoint earlier
+    #      request gets refetched. Windows that came back empty are not
+    #      covered, their negative entry decides when they are asked again.
+    def _manifest(self, key, period):
+        filename = self._manifest_file(key)
+        manifest = None
+
+        if self._exists(filename):
+            manifest = self._read(filename)
+
+        if manifest is not None:
+            manifest = upgrade_manifest(manifest)
+            missing = [shard for shard in manifest['shards']
+                       if not self._exists(self._shard_file(key, shard,
+                                                            create=False))]
+
+            if missing:
+                for shard in missing:
+                    self._drop_shard(manifest, shard)
+
+                self._write(manifest, filename, evict=False, evictable=False)
+
+            return manifest
+
+        manifest = {'shards': {}, 'covered': []}
+
+        # NOTE Split histories cached before sharding on first access
+        legacy = self._get_file(key, create=False)
+        if not self._exists(legacy):
+            return manifest
+
+        history = self._read(legacy)
+        if history is None:
+            return manifest
+
+        LOG.info("Sharding cached history %s" % key)
+        covered = None
+        if not history.empty:
+            covered = (history.index[0].date(), history.index[-1].date())
+
+        manifest = self._write_history(key, period, history, manifest,
+                                       covered)
+        self._remove(legacy)
+        return manifest
+
+    def _write_history(self, key, period, history, manifest, covered=None):
+        if history.empty and covered is None:
+            return manifest
+
+        manifest_file = self._manifest_file(key)
+        shards = manifest['shards']
+
+        if not history.empty:
+            for shard, part in history.groupby(
+                    self._shard_names(period, history.index)):
+                filename = self._shard_file(key, shard)
+
+                if shard in shards:
+                    cached = None
+                    if self._exists(filename):
+                        cached = self._read(filename)
+
+                    if cached is None:
+                        self._drop_shard(manifest, shard)
+
+                    else:
+                        part = cached.combine_first(part)
+
+                self._write(part, filename, evict=False)
+                shards[shard] = (part.index[0], part.index[-1], len(part))
+
+        if covered is not None:
+            manifest['covered'] = merge_spans(manifest['covered'] + [covered])
+
+        self._write(manifest, manifest_file, evict=False, evictable=False)
+
+        with self._lock:
+            self._evict()
+            self._flush()
+
+        return manifest
+
+    @staticmethod
+    def _drop_shard(manifest, shard):
+        manifest['shards'].pop(shard, None)
+        manifest['covered'] = subtract_span(manifest['covered'],
+                                            *shard_span(shard))
+
+    @staticmethod
+    def _shards(manifest, start=None, end=None):
+        return [shard for shard, (first, last, _)
+                in sorted(manifest['shards'].iteritems())
+                if (start is None or last.date() >= start.date()) and
+                (end is None or first.date() <= end.date())]
+
+    # NOTE Returns None, after dropping them from the manifest, when shards
+    #      were removed underneath it
+    def _read_history(self, key, manifest, start=None, end=None):
+        shards = []
+        dropped = False
+
+        for shard in self._shards(manifest, start, end):
+            history = self._read(self._shard_file(key, shard, create=False))
+
+            if history is None:
+                self._drop_shard(manifest, shard)
+                dropped = True
+
+            else:
+                shards.append(history)
+
+        if dropped:
+            self._write(manifest, self._manifest_file(key), evict=False,
+                        evictable=False)
+            return None
+
+        if not shards:
+            return pd.DataFrame()
+
+        return pd.concat(shards)
+
+    @staticmethod
+    def _gaps(manifest, start, search_end, exchange_end):
+        # NOTE Nothing past the exchange's last trade date can be fetched yet
+        upper = min(search_end, exchange_end).date()
+        return gaps(manifest['covered'], start.date(), upper)
+
+    def _derive_history(self, exchange, symbol, start, end, period,
+                        exchange_end):
+        source = _DERIVED_PERIODS.get(str(period))
+        if source is None:
+            return None
+
+        key = self._get_key('history', exchange, symbol, 'period_%s' % source)
+        search_end = exchange_end if end is None else end
+
+        # NOTE Every bucket the window touches has to be covered from its
+        #      first day to its last, a partial bucket is not the bar the
+        #      API would return
+        lower, upper = bucket_bounds(period, start, search_end)
+
+        with self._holding(key):
+            manifest = self._manifest(key, source)
+
+            if (not manifest['shards'] or
+                    self._gaps(manifest, lower, upper, exchange_end)):
+                return None
+
+            LOG.info("Deriving period %s history for %s:%s from period %s" %
+                     (period, exchange, symbol, source))
+            finer = self._read_history(key, manifest, lower, upper)
+
+        if finer is None:
+            return None
+
+        return slice_history(resample_history(finer, period), start, end)
+
+    # NOTE Pass record=False for reads that are not demand, e.g. backfills,
+    #      so they don't skew what prewarm considers hot
+    def history(self, exchange, symbol, start, end=None, period='d',
+                record=True):
+        return self._compact(self._cached_history(exchange, symbol, start,
+                                                  end, period, record))
+
+    # NOTE Only asked before fetching, a cache hit doesn't need to load the
+    #      exchange's symbol list
+    def _is_unknown(self, exchange, symbol):
+        key = ('symbol', exchange, symbol)
+
+        if self._is_negative(key):
+            return True
+
+        if symbol not in self.symbols(exchange):
+            self._set_negative(key, self.negative_ttl)
+            return True
+
+        return False
+
+    def _cached_history(self, exchange, symbol, start, end=None, period='d',
+                        record=True):
+        exchanges = self.exchanges()
+        tz = self.exchange_tz(exchange, exchanges=exchanges)
         start = timetastic(start, tz)
         end = timetastic(end, tz)
 
         period_key = 'period_%s' % period
         key = self._get_key('history', exchange, symbol, period_key)
-        filename = self._get_file(key)
 
-        exchange_end = self._last_trade_date(exchange)
+        if record:
+            self._record_access(exchange, symbol, period, start, end)
+
+        if self._is_negative(('symbol', exchange, symbol)):
+            return pd.DataFrame()
+
+        exchange_end = exchanges[exchange]['last_trade_date_time']
 
         if end is not None and end > exchange_end:
             end = exchange_end
 
-        if not self._can_haz_cache(key):
-            history = self._history(exchange, symbol, start, end, period)
+        history = self._derive_history(exchange, symbol, start, end, period,
+                                       exchange_end)
+        if history is not None:
+            return history
+
+        if end is None:
+            search_end = timetastic(pd.datetime.now(), tz)
+
+        else:
+            search_end = end
+
+        with self._holding(key):
+            manifest = self._manifest(key, period)
+
+            # NOTE Shards removed while being read are refetched, a few times
+            for attempt in range(3):
+                missing = self._gaps(manifest, start, search_end, exchange_end)
+
+                if not missing and not attempt:
+                    self.hits += 1
+
+                if missing and self._is_unknown(exchange, symbol):
+                    return pd.DataFrame()
 
-            if history.empty:
-                return history
+                for lower, upper in missing:
+                    self._fill_history(key, exchange, symbol, lower, upper,
+                                       period, manifest, tz, exchange_end)
 
-            if os.path.exists(filename):
-                cached_history = pd.read_pickle(filename)
-                cached_history.combine_first(history).to_pickle(filename)
+                history = self._read_history(key, manifest, start, search_end)
+
+                if history is not None:
+                    break
 
             else:
-                history.to_pickle(filename)
+                LOG.warning("Shards of %s keep disappearing from the cache, "
+                            "returning the window uncached" % key)
+                history = self._history(exchange, symbol, start, search_end,
+                                        period)
 
+        if history.empty:
             return history
 
-        cached_history = pd.read_pickle(filename)
-
         if end is None:
-            now = timetastic(pd.datetime.now(), tz)
-            history = cached_history.ix[start:now]
+            return history.ix[start:search_end]
 
-        else:
-            # NOTE(jkoelker) String date indexing allows any time on the date
-            history = cached_history.ix[str(start):str(end.date())]
+        return slice_history(history, start, end)
 
-        if not history.empty:
-            first_record = history.index[0]
-            last_record = history.index[-1]
+    def _fill_history(self, key, exchange, symbol, lower, upper, period,
+                      manifest, tz, exchange_end):
+        start = timetastic(str(lower), tz)
+        end = timetastic(str(upper), tz) + pd.DateOffset(days=1)
+        end -= pd.DateOffset(microseconds=1)
 
-            # TODO(jkoelker) handle missing intraday data
-            if start.date() < first_record.date():
-                new_history = self._history(exchange, symbol, start,
-                                            first_record, period)
+        history = self._history(exchange, symbol, start, end, period)
 
-                if not new_history.empty:
-                    cached_history = cached_history.combine_first(new_history)
-                    cached_history.to_pickle(filename)
+        if history.empty:
+            return manifest
 
-                    history = history.combine_first(new_history)
+        # NOTE The last trade date may still gain bars, it only counts as
+        #      covered once a bar for it came back
+        last_trade = exchange_end.date()
+        if upper >= last_trade:
+            upper = last_trade - datetime.timedelta(days=1)
 
-            if end is None:
-                search_end = timetastic(pd.datetime.now(), tz)
+            if history.index[-1].date() >= last_trade:
+                upper = last_trade
+
+        covered = (lower, upper) if lower <= upper else None
+        return self._write_history(key, period, history, manifest, covered)
+
+    def histories(self, exchange, symbols, start, end=None, period='d',
+                  processes=None):
+        tz = self.exchange_tz(exchange)
+        start = timetastic(start, tz)
+        end = timetastic(end, tz)
+
+        exchange_end = self._last_trade_date(exchange)
+
+        if end is not None and end > exchange_end:
+            end = exchange_end
+
+        search_end = end
+        if search_end is None:
+            search_end = timetastic(pd.datetime.now(), tz)
+
+        # NOTE Only symbols whose cached history covers the whole window are
+        #      read in the pool, the rest go through _cached_history to fetch
+        #      what is missing
+        period_key = 'period_%s' % period
+        jobs = []
+        for i, symbol in enumerate(symbols):
+            key = self._get_key('history', exchange, symbol, period_key)
+
+            if self._exists(self._get_file(self._get_key(key, 'manifest'),
+                                           create=False)):
+                jobs.append((i, ('/'.join((self.directory, key)), start, end,
+                                 search_end, exchange_end)))
+
+        packed = [None] * len(symbols)
+
+        if jobs:
+            if processes is None:
+                processes = multiprocessing.cpu_count()
+
+            processes = min(processes, len(jobs))
+            pool = multiprocessing.Pool(processes)
+            try:
+                chunksize = max(1, len(jobs) // (processes * 4))
+                results = pool.map(_load_history, [job for _, job in jobs],
+                                   chunksize)
+            finally:
+                pool.close()
+                pool.join()
+
+            for (i, _), result in zip(jobs, results):
+                packed[i] = result
+
+        now = time.time()
+        histories = []
+        for symbol, result in zip(symbols, packed):
+            if result is None:
+                history = self._cached_history(exchange, symbol, start, end,
+                                               period, record=False)
 
             else:
-                search_end = end
+                filenames, history = result
+                self.hits += 1
+                with self._lock:
+                    for filename in filenames:
+                        entry = self._entry(filename)
+                        if entry is not None:
+                            entry['accessed'] = now
+                            self._dirty.add(filename)
+                            self._touch(filename, entry)
 
-            if last_record.date() < search_end.date():
-                new_history = self._history(exchange, symbol, last_record,
-                                            search_end, period)
-                if not new_history.empty:
-                    cached_history = cached_history.combine_first(new_history)
-                    cached_history.to_pickle(filename)
-                    history = history.combine_first(new_history)
+                history = unpack_history(history)
 
-        return history
+            histories.append(history)
+
+        if not histories:
+            return pd.DataFrame()
+
+        return self._compact(pd.concat(histories, keys=symbols,
+                                       names=['symbol', 'date_time']))
+
+
+# NOTE The connection is shared by every thread using the cache (e.g. the
+#      backfill workers), statements and transactions on it are serialized
+#      with a lock
+class SQLiteCache(CacheManager):
+    COLUMNS = ('open', 'high', 'low', 'close', 'volume', 'open_interest')
+
+    def __init__(self, client, directory=None, name='eoddata',
+                 filename='history.sqlite', *args, **kwargs):
+        CacheManager.__init__(self, client, directory, name, *args, **kwargs)
+
+        self.filename = os.path.join(self.directory, filename)
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(self.filename, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self._create()
+
+    def _create(self):
+        columns = ', '.join('%s %s' % (col, 'INTEGER' if col in
+                                       ('volume', 'open_interest') else
+                                       'REAL') for col in self.COLUMNS)
+
+        with self._lock, self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS meta ('
+                              'key TEXT PRIMARY KEY, fetched REAL, '
+                              'value BLOB)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS history ('
+                              'exchange TEXT, period TEXT, '
+                              'datetime INTEGER, symbol TEXT, %s, '
+                              'PRIMARY KEY (exchange, period, symbol, '
+                              'datetime))' % columns)
+            self.conn.execute('CREATE INDEX IF NOT EXISTS history_date ON '
+                              'history (exchange, period, datetime, symbol)')
+
+    def close(self, *args, **kwargs):
+        with self._lock:
+            self.conn.close()
+
+    def _meta(self, key, expiration, fetch):
+        with self._lock:
+            row = self.conn.execute('SELECT fetched, value FROM meta '
+                                    'WHERE key = ?', (key,)).fetchone()
+
+        if row is not None and self._is_fresh(row[0], expiration):
+            return compression.loads(str(row[1]))
+
+        value = fetch()
+        blob = compression.dumps(value, self.codec, self.codec_level)
+
+        with self._lock, self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?, ?)',
+                              (key, time.time(), sqlite3.Binary(blob)))
+
+        return value
+
+    def exchanges(self, expiration='1d'):
+        fetch = lambda: CacheManager.exchanges(self, expiration)
+        return self._meta('exchanges', expiration, fetch)
+
+    def symbols(self, exchange, expiration='1d'):
+        def fetch():
+            symbols = CacheManager.symbols(self, exchange, expiration)
+            self.symbol_master.refresh(exchange, symbols.to_dict())
+            return symbols
+
+        return self._meta('symbols/%s' % exchange, expiration, fetch)
+
+    def _insert(self, exchange, symbol, period, history):
+        if history.empty:
+            return
+
+        rows = len(history)
+        columns = [history[col].values if col in history else [None] * rows
+                   for col in self.COLUMNS]
+        rows = zip([exchange] * rows, [str(period)] * rows,
+                   history.index.asi8, [symbol] * rows, *columns)
+
+        placeholders = ', '.join(['?'] * (len(self.COLUMNS) + 4))
+        with self._lock, self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO history VALUES '
+                                  '(%s)' % placeholders,
+                                  [tuple(value.item()
+                                         if hasattr(value, 'item') else value
+                                         for value in row) for row in rows])
+
+    def _frame(self, sql, params, tz, index='date_time'):
+        columns = ('datetime', 'symbol') + self.COLUMNS
+        with self._lock:
+            rows = self.conn.execute(sql % ', '.join(columns),
+                                     params).fetchall()
+
+        if not rows:
+            return pd.DataFrame()
+
+        frame = pd.DataFrame.from_records(rows, columns=columns)
+        frame['datetime'] = pd.DatetimeIndex(frame['datetime'].values)\
+            .tz_localize('UTC').tz_convert(tz)
+        frame = frame.rename(columns={'datetime': 'date_time'})
+        return frame.set_index(index)
+
+    def _bounds(self, exchange, symbol, period):
+        with self._lock:
+            return self.conn.execute('SELECT MIN(datetime), MAX(datetime) '
+                                     'FROM history WHERE exchange = ? AND '
+                                     'period = ? AND symbol = ?',
+                                     (exchange, str(period),
+                                      symbol)).fetchone()
+
+    def _select(self, exchange, symbol, period, start, end, tz):
+        sql = ('SELECT %s FROM history WHERE exchange = ? AND period = ? AND '
+               'symbol = ? AND datetime >= ? AND datetime <= ? '
+               'ORDER BY datetime')
+        return self._frame(sql, (exchange, str(period), symbol,
+                                 start.value, end.value), tz)
+
+    def _history(self, exchange, symbol, start, end=None, period='d'):
+        return CacheManager._fetch_history(self, exchange, symbol, start, end,
+                                           period)
+
+    def history(self, exchange, symbol, start, end=None, period='d'):
+        return self._compact(self._cached_history(exchange, symbol, start,
+                                                  end, period))
+
+    def _cached_history(self, exchange, symbol, start, end=None, period='d'):
+        tz = self.exchange_tz(exchange)
+        start = timetastic(start, tz)
+        end = timetastic(end, tz)
+
+        exchange_end = self._last_trade_date(exchange)
+
+        if end is not None and end > exchange_end:
+            end = exchange_end
+
+        search_end = end
+        if search_end is None:
+            search_end = timetastic(pd.datetime.now(), tz)
+
+        first, last = self._bounds(exchange, symbol, period)
+
+        if first is None:
+            self._insert(exchange, symbol, period,
+                         self._history(exchange, symbol, start, search_end,
+                                       period))
+
+        else:
+            first = pd.Timestamp(first, tz='UTC').tz_convert(tz)
+            last = pd.Timestamp(last, tz='UTC').tz_convert(tz)
+
+            if start.date() < first.date():
+                self._insert(exchange, symbol, period,
+                             self._history(exchange, symbol, start, first,
+                                           period))
+
+            if last.date() < search_end.date():
+                self._insert(exchange, symbol, period,
+                             self._history(exchange, symbol, last, search_end,
+                                           period))
+
+        # NOTE(jkoelker) String date indexing allows any time on the date
+        if end is not None:
+            search_end = timetastic(str(end.date()), tz) + pd.DateOffset(days=1)
+            search_end -= pd.DateOffset(microseconds=1)
+
+        return self._select(exchange, symbol, period, start, search_end, tz)
+
+    def cross_section(self, exchange, date, period='d'):
+        tz = self.exchange_tz(exchange)
+        start = timetastic(str(timetastic(date, tz).date()), tz)
+        end = start + pd.DateOffset(days=1)
+
+        sql = ('SELECT %s FROM history WHERE exchange = ? AND period = ? AND '
+               'datetime >= ? AND datetime < ? ORDER BY symbol, datetime')
+        return self._frame(sql, (exchange, str(period), start.value,
+                                 end.value), tz, index='symbol')
+
+    def movers(self, exchange, start, end=None, period='d', n=10):
+        tz = self.exchange_tz(exchange)
+        start = timetastic(start, tz)
+        end = timetastic(end, tz)
+
+        if end is None:
+            end = timetastic(pd.datetime.now(), tz)
+
+        sql = ('SELECT %s FROM history WHERE exchange = ? AND period = ? AND '
+               'datetime >= ? AND datetime <= ? ORDER BY symbol, datetime')
+        window = self._frame(sql, (exchange, str(period), start.value,
+                                   end.value), tz)
+
+        if window.empty:
+            return pd.Series()
+
+        closes = window.groupby('symbol')['close']
+        change = (closes.last() - closes.first()) / closes.first()
+        change = change.dropna()
+        return change.reindex(change.abs().order(ascending=False).index[:n])
 
 
 class DataReader(object):
@@ -282,6 +1503,8 @@ class DataReader(object):
             self.datasource = Manager(client)
         elif cache is True:
             self.datasource = PickleCache(client)
+        elif cache == 'sqlite':
+            self.datasource = SQLiteCache(client)
         else:
             self.datasource = cache
 
@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 import itertools
+import os
 
+import numpy as np
+import pandas as pd
 from zipline.sources import data_source
 from zipline.finance import trading
 from zipline.data import loader_utils
@@ -94,3 +97,99 @@ class EODData(data_source.DataSource):
             self._raw_data = self.raw_data_gen()
 
         return self._raw_data
+
+
+BUNDLE_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+
+# NOTE A bundle is a directory of .npy files: the UTC bar times as int64
+#      nanoseconds, one (dates x sids) array per field aligned on those
+#      times (NaN where a sid has no bar), and the sid -> exchange/symbol
+#      mapping. Loading it memory maps the arrays, so a backtest skips the
+#      DataReader fetch and every conversion step.
+def export_bundle(path, symbols, period, start, end, username, password,
+                  cache=True):
+    reader = datareader.DataReader(username, password, cache)
+    histories = {}
+
+    for exchange, symbol in symbols:
+        history = reader(exchange, symbol, start, end, period)
+
+        if history.empty:
+            continue
+
+        history = history.copy()
+        history.index = history.index.tz_convert('UTC')
+        histories[(exchange, symbol)] = history
+
+    sids = sorted(histories)
+    dates = pd.DatetimeIndex([])
+    for history in histories.itervalues():
+        dates = dates.union(history.index)
+
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    np.save(os.path.join(path, 'dates.npy'), dates.asi8)
+    np.save(os.path.join(path, 'exchanges.npy'),
+            np.array([exchange for exchange, _ in sids]))
+    np.save(os.path.join(path, 'symbols.npy'),
+            np.array([symbol for _, symbol in sids]))
+    np.save(os.path.join(path, 'meta.npy'),
+            np.array([str(period), str(start), str(end)]))
+
+    for field in BUNDLE_FIELDS:
+        values = np.empty((len(dates), len(sids)), dtype='float64')
+
+        for i, sid in enumerate(sids):
+            values[:, i] = histories[sid][field].reindex(dates).values
+
+        np.save(os.path.join(path, '%s.npy' % field), values)
+
+    return sids
+
+
+class EODDataBundle(EODData):
+    def __init__(self, path, symbols=None):
+        load = lambda name: np.load(os.path.join(path, '%s.npy' % name),
+                                    mmap_mode='r')
+
+        self.path = path
+        self.period, self.start, self.end = [str(v) for v in load('meta')]
+        self.dates = pd.DatetimeIndex(np.asarray(load('dates'))).tz_localize(
+            'UTC')
+        self.sids = list(zip(load('exchanges'), load('symbols')))
+        self.symbols = self.sids
+        self.columns = np.arange(len(self.sids))
+
+        if symbols is not None:
+            symbols = set(symbols)
+            self.symbols = [sid for sid in self.sids if sid in symbols]
+            self.columns = np.array([i for i, sid in enumerate(self.sids)
+                                     if sid in symbols], dtype=int)
+
+        self.fields = dict([(field, load(field)) for field in BUNDLE_FIELDS])
+
+    @property
+    def instance_hash(self):
+        return "EODDataBundle"
+
+    def raw_data_gen(self):
+        names = [str(symbol) for _, symbol in self.sids]
+
+        for row, dt in enumerate(self.dates):
+            bars = dict([(field, np.asarray(values[row, self.columns]))
+                         for field, values in self.fields.iteritems()])
+
+            for j, col in enumerate(self.columns):
+                if bars['close'][j] != bars['close'][j]:
+                    continue
+
+                yield {'dt': dt,
+                       'sid': names[col],
+                       'close': bars['close'][j],
+                       'open': bars['open'][j],
+                       'volume': bars['volume'][j],
+                       'high': bars['high'][j],
+                       'low': bars['low'][j],
+                       }
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+
+import collections
+
+import lazy
+
+pd = lazy.LazyModule('pandas')
+
+
+NAN = float('nan')
+
+DEFAULTS = {'sma': (20, 50, 200),
+            'ema': (12, 26),
+            'rsi': 14,
+            'atr': 14,
+            'extremes': (20, 260)}
+
+
+# NOTE EMA, RSI and ATR all use the recursive (adjust=False) form so the
+#      vectorized values and the incremental updates below agree exactly.
+#      RSI and ATR use Wilder's smoothing, alpha = 1 / n.
+def sma(close, n):
+    return pd.rolling_mean(close, n)
+
+
+def ema(close, n):
+    return pd.ewma(close, span=n, adjust=False)
+
+
+def rsi(close, n=14):
+    delta = close.diff()
+    gain = pd.ewma(delta.clip(lower=0), com=n - 1, adjust=False)
+    loss = pd.ewma(-delta.clip(upper=0), com=n - 1, adjust=False)
+    return 100 - 100 / (1 + gain / loss)
+
+
+def true_range(high, low, close):
+    prev = close.shift(1)
+    return pd.concat([high - low, (high - prev).abs(), (low - prev).abs()],
+                     axis=1).max(axis=1)
+
+
+def atr(high, low, close, n=14):
+    return pd.ewma(true_range(high, low, close), com=n - 1, adjust=False)
+
+
+def rolling_high(high, n):
+    return pd.rolling_max(high, n)
+
+
+def rolling_low(low, n):
+    return pd.rolling_min(low, n)
+
+
+_sma, _ema, _rsi, _atr = sma, ema, rsi, atr
+
+
+def compute(history, sma=DEFAULTS['sma'], ema=DEFAULTS['ema'],
+            rsi=DEFAULTS['rsi'], atr=DEFAULTS['atr'],
+            extremes=DEFAULTS['extremes']):
+    close = history['close']
+    columns = collections.OrderedDict()
+
+    for n in sma:
+        columns['sma_%d' % n] = _sma(close, n)
+
+    for n in ema:
+        columns['ema_%d' % n] = _ema(close, n)
+
+    if rsi:
+        columns['rsi_%d' % rsi] = _rsi(close, rsi)
+
+    if atr:
+        columns['atr_%d' % atr] = _atr(history['high'], history['low'], close,
+                                       atr)
+
+    for n in extremes:
+        columns['high_%d' % n] = rolling_high(history['high'], n)
+        columns['low_%d' % n] = rolling_low(history['low'], n)
+
+    return pd.DataFrame(columns, index=history.index)
+
+
+def _ewm(prev, value, alpha):
+    if value != value:
+        return prev
+
+    if prev is None:
+        return value
+
+    return alpha * value + (1 - alpha) * prev
+
+
+class Extreme(object):
+    def __init__(self, n, compare):
+        self.n = n
+        self.compare = compare
+        self.window = collections.deque()
+        self.count = 0
+
+    # NOTE Monotonic deque, each value is pushed and popped at most once
+    def update(self, value):
+        while self.window and not self.compare(self.window[-1][1], value):
+            self.window.pop()
+
+        self.window.append((self.count, value))
+        self.count += 1
+
+        if self.window[0][0] <= self.count - 1 - self.n:
+            self.window.popleft()
+
+        if self.count < self.n:
+            return NAN
+
+        return self.window[0][1]
+
+
+class Indicators(object):
+    def __init__(self, sma=DEFAULTS['sma'], ema=DEFAULTS['ema'],
+                 rsi=DEFAULTS['rsi'], atr=DEFAULTS['atr'],
+                 extremes=DEFAULTS['extremes']):
+        self.periods = {'sma': sma, 'ema': ema, 'rsi': rsi, 'atr': atr,
+                        'extremes': extremes}
+        self.last = None
+        self.values = {}
+        self._sma = dict([(n, (collections.deque(), [0.0])) for n in sma])
+        self._ema = dict([(n, None) for n in ema])
+        self._rsi = [None, None]
+        self._atr = None
+        self._prev_close = None
+        self._highs = [Extreme(n, lambda a, b: a > b) for n in extremes]
+        self._lows = [Extreme(n, lambda a, b: a < b) for n in extremes]
+
+    def update(self, bar, ts=None):
+        high, low, close = bar['high'], bar['low'], bar['close']
+        prev = self._prev_close
+        values = {}
+
+        for n, (window, total) in self._sma.iteritems():
+            window.append(close)
+            total[0] += close
+
+            if len(window) > n:
+                total[0] -= window.popleft()
+
+            values['sma_%d' % n] = total[0] / n if len(window) == n else NAN
+
+        for n, value in self._ema.iteritems():
+            value = self._ema[n] = _ewm(value, close, 2.0 / (n + 1))
+            values['ema_%d' % n] = value
+
+        n = self.periods['rsi']
+        if n:
+            if prev is not None:
+                delta = close - prev
+                self._rsi[0] = _ewm(self._rsi[0], max(delta, 0), 1.0 / n)
+                self._rsi[1] = _ewm(self._rsi[1], max(-delta, 0), 1.0 / n)
+
+            gain, loss = self._rsi
+            value = NAN
+            if gain is not None:
+                value = 100.0 if not loss else 100 - 100 / (1 + gain / loss)
+
+            values['rsi_%d' % n] = value
+
+        n = self.periods['atr']
+        if n:
+            tr = high - low
+            if prev is not None:
+                tr = max(tr, abs(high - prev), abs(low - prev))
+
+            self._atr = _ewm(self._atr, tr, 1.0 / n)
+            values['atr_%d' % n] = self._atr
+
+        for extreme in self._highs:
+            values['high_%d' % extreme.n] = extreme.update(high)
+
+        for extreme in self._lows:
+            values['low_%d' % extreme.n] = extreme.update(low)
+
+        self._prev_close = close
+        self.last = ts
+        self.values = values
+        return values
+
+    @classmethod
+    def from_history(cls, history, **kwargs):
+        indicators = cls(**kwargs)
+        indicators.seed(history)
+        return indicators
+
+    def seed(self, history):
+        if history.empty:
+            return self.values
+
+        # NOTE Only the tail needed to fill every window is replayed, the
+        #      recursive averages are seeded from the vectorized results
+        close = history['close']
+        computed = compute(history, **self.periods)
+        tail = max(list(self.periods['sma']) +
+                   list(self.periods['extremes']) + [1])
+
+        for n in self._ema:
+            self._ema[n] = computed['ema_%d' % n].iloc[-tail - 1] \
+                if len(history) > tail else None
+
+        if len(history) > tail:
+            n = self.periods['rsi']
+            if n:
+                delta = close.diff()
+                self._rsi = [pd.ewma(delta.clip(lower=0), com=n - 1,
+                                     adjust=False).iloc[-tail - 1],
+                             pd.ewma(-delta.clip(upper=0), com=n - 1,
+                                     adjust=False).iloc[-tail - 1]]
+                if self._rsi[0] != self._rsi[0]:
+                    self._rsi = [None, None]
+
+            if self.periods['atr']:
+                self._atr = computed['atr_%d' % self.periods['atr']]\
+                    .iloc[-tail - 1]
+
+            self._prev_close = close.iloc[-tail - 1]
+
+        for ts, bar in history.iloc[-tail:].iterrows():
+            self.update(bar, ts)
+
+        return self.values
+
+
+class IndicatorEngine(object):
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.symbols = {}
+
+    def update(self, symbol, history):
+        indicators = self.symbols.get(symbol)
+
+        if indicators is None:
+            indicators = Indicators.from_history(history, **self.kwargs)
+            self.symbols[symbol] = indicators
+            return indicators.values
+
+        if indicators.last is not None:
+            history = history[history.index > indicators.last]
+
+        for ts, bar in history.iterrows():
+            indicators.update(bar, ts)
+
+        return indicators.values
+
+    def frame(self):
+        return pd.DataFrame(dict([(symbol, indicators.values)
+                                  for symbol, indicators
+                                  in self.symbols.iteritems()])).T
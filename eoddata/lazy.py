@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+import importlib
+
+
+# NOTE Stand-in for a module that is only imported the first time one of its
+#      attributes is used, so `import eoddata` doesn't pay for scio or pandas
+#      until a code path actually needs them.
+class LazyModule(object):
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_module']
+
+        if module is None:
+            module = importlib.import_module(self.__dict__['_name'])
+            self.__dict__['_module'] = module
+
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __repr__(self):
+        return '<lazy module %r>' % self.__dict__['_name']
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import datetime
+import logging
+import os
+import time
+
+import datareader
+import ws
+
+
+LOG = logging.getLogger(__name__)
+
+
+def next_run(at, now=None):
+    if now is None:
+        now = datetime.datetime.now()
+
+    hour, minute = [int(part) for part in at.split(':')]
+    run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+
+    if run <= now:
+        run += datetime.timedelta(days=1)
+
+    return run
+
+
+def run(cache, at=None, n=None, budget=None, since='7d', once=False):
+    while True:
+        if at is not None:
+            when = next_run(at)
+            LOG.info("Next prewarm at %s" % when)
+            time.sleep((when - datetime.datetime.now()).total_seconds())
+
+        warmed = cache.prewarm(n=n, budget=budget, since=since)
+        LOG.info("Prewarmed %d entries: %s" % (len(warmed), cache.stats()))
+
+        if once or at is None:
+            return warmed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Refresh the most requested '
+                                                 'EODData cache entries')
+    parser.add_argument('--username',
+                        default=os.environ.get('EODDATA_USERNAME'))
+    parser.add_argument('--password',
+                        default=os.environ.get('EODDATA_PASSWORD'))
+    parser.add_argument('--directory', default=None,
+                        help='PickleCache directory')
+    parser.add_argument('--at', default=None,
+                        help='local HH:MM to prewarm at every day, '
+                             'otherwise prewarm once now')
+    parser.add_argument('--top', type=int, default=None,
+                        help='number of hottest entries to refresh')
+    parser.add_argument('--budget', type=int, default=None,
+                        help='maximum number of upstream requests')
+    parser.add_argument('--since', default='7d',
+                        help='only consider entries accessed within this '
+                             'window')
+    parser.add_argument('--once', action='store_true',
+                        help='exit after the first scheduled prewarm')
+    args = parser.parse_args(argv)
+
+    if not args.username or not args.password:
+        parser.error('--username and --password (or EODDATA_USERNAME and '
+                     'EODDATA_PASSWORD) are required')
+
+    logging.basicConfig(level=logging.INFO)
+
+    client = ws.Client(args.username, args.password)
+    cache = datareader.PickleCache(client, directory=args.directory)
+
+    try:
+        run(cache, at=args.at, n=args.top, budget=args.budget,
+            since=args.since, once=args.once)
+
+    finally:
+        cache.close()
+
+
+if __name__ == '__main__':
+    main()
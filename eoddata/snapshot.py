@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+
+import calendar
+import datetime
+import os
+import tempfile
+import time
+
+import cPickle as pickle
+
+
+KEYFRAME_INTERVAL = 30
+
+
+def date_key(date=None):
+    if date is None:
+        date = datetime.date.today()
+
+    if not isinstance(date, basestring):
+        date = date.strftime('%Y%m%d')
+
+    return date
+
+
+def same(a, b):
+    if a == b:
+        return True
+
+    # NOTE nan != nan, but an unchanged nan is not a change
+    return a != a and b != b
+
+
+def diff(old, new):
+    changed = {}
+    removed_fields = {}
+
+    for symbol, record in new.iteritems():
+        old_record = old.get(symbol)
+
+        if old_record is None:
+            changed[symbol] = dict(record)
+            continue
+
+        fields = dict([(k, v) for k, v in record.iteritems()
+                       if k not in old_record or not same(old_record[k], v)])
+
+        if fields:
+            changed[symbol] = fields
+
+        dropped = [k for k in old_record if k not in record]
+        if dropped:
+            removed_fields[symbol] = dropped
+
+    removed = [symbol for symbol in old if symbol not in new]
+    return changed, removed, removed_fields
+
+
+def patch(snapshot, changed, removed, removed_fields=None):
+    for symbol in removed:
+        snapshot.pop(symbol, None)
+
+    for symbol, fields in (removed_fields or {}).iteritems():
+        record = snapshot.get(symbol, {})
+        for field in fields:
+            record.pop(field, None)
+
+    for symbol, fields in changed.iteritems():
+        snapshot.setdefault(symbol, {}).update(fields)
+
+    return snapshot
+
+
+def dump(obj, filename):
+    path = os.path.dirname(filename)
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(filename) + '.',
+                               suffix='.tmp', dir=path)
+    with os.fdopen(fd, 'wb') as f:
+        pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
+
+    os.rename(tmp, filename)
+
+
+def load(filename):
+    with open(filename, 'rb') as f:
+        return pickle.load(f)
+
+
+# NOTE Each save only writes the fields that changed since the previous
+#      snapshot. A full keyframe is written every `keyframe_interval` saves
+#      so rebuilding a historical snapshot never replays more deltas than
+#      that.
+class SnapshotStore(object):
+    def __init__(self, directory, keyframe_interval=KEYFRAME_INTERVAL):
+        self.directory = directory
+        self.keyframe_interval = keyframe_interval
+
+    def _path(self, kind, exchange, *parts):
+        return os.path.join(self.directory, kind, exchange, *parts)
+
+    def _file(self, kind, exchange, section, date):
+        return self._path(kind, exchange, section, '.'.join((date, 'pkl')))
+
+    def _dates(self, kind, exchange, section):
+        path = self._path(kind, exchange, section)
+        if not os.path.exists(path):
+            return []
+
+        return sorted([f[:-4] for f in os.listdir(path) if f.endswith('.pkl')])
+
+    def dates(self, kind, exchange):
+        return self._dates(kind, exchange, 'deltas')
+
+    def mtime(self, kind, exchange):
+        dates = self.dates(kind, exchange)
+        if not dates:
+            return None
+
+        return os.path.getmtime(self._file(kind, exchange, 'deltas',
+                                           dates[-1]))
+
+    def load(self, kind, exchange, date=None):
+        dates = self.dates(kind, exchange)
+
+        if date is not None:
+            date = date_key(date)
+            dates = [d for d in dates if d <= date]
+
+        if not dates:
+            return None
+
+        keyframes = [k for k in self._dates(kind, exchange, 'keyframes')
+                     if k <= dates[-1]]
+
+        snapshot = {}
+        if keyframes:
+            snapshot = load(self._file(kind, exchange, 'keyframes',
+                                       keyframes[-1]))
+            dates = [d for d in dates if d > keyframes[-1]]
+
+        for d in dates:
+            delta = load(self._file(kind, exchange, 'deltas', d))
+            patch(snapshot, delta['changed'], delta['removed'],
+                  delta.get('removed_fields'))
+
+        return snapshot
+
+    def save(self, kind, exchange, snapshot, date=None):
+        date = date_key(date)
+        dates = self.dates(kind, exchange)
+
+        if dates and date < dates[-1]:
+            raise ValueError("Cannot save %s snapshot for %s on %s before "
+                             "the latest snapshot on %s" % (kind, exchange,
+                                                            date, dates[-1]))
+
+        previous = [d for d in dates if d < date]
+        base = {}
+        if previous:
+            base = self.load(kind, exchange, previous[-1])
+
+        changed, removed, removed_fields = diff(base, snapshot)
+        dump({'changed': changed, 'removed': removed,
+              'removed_fields': removed_fields},
+             self._file(kind, exchange, 'deltas', date))
+
+        keyframes = [k for k in self._dates(kind, exchange, 'keyframes')
+                     if k < date]
+        since_keyframe = previous
+        if keyframes:
+            since_keyframe = [d for d in previous if d > keyframes[-1]]
+
+        keyframe = self._file(kind, exchange, 'keyframes', date)
+
+        if (not keyframes or os.path.exists(keyframe) or
+                len(since_keyframe) >= self.keyframe_interval):
+            dump(snapshot, keyframe)
+
+        return changed, removed
+
+    def changed_since(self, kind, exchange, since, date=None):
+        since = date_key(since)
+        dates = self.dates(kind, exchange)
+
+        if date is not None:
+            date = date_key(date)
+            dates = [d for d in dates if d <= date]
+
+        symbols = set()
+        for d in dates:
+            if d <= since:
+                continue
+
+            delta = load(self._file(kind, exchange, 'deltas', d))
+            symbols.update(delta['changed'])
+            symbols.update(delta.get('removed_fields', ()))
+
+        snapshot = self.load(kind, exchange, date) or {}
+        return dict([(symbol, snapshot[symbol]) for symbol in symbols
+                     if symbol in snapshot])
+
+
+def epoch(ts=None):
+    if ts is None:
+        return time.time()
+
+    if isinstance(ts, (int, long, float)):
+        return float(ts)
+
+    # NOTE Same date strings SnapshotStore takes, 'YYYY-MM-DD' or 'YYYYMMDD'
+    if isinstance(ts, basestring):
+        ts = datetime.datetime.strptime(ts.replace('-', ''), '%Y%m%d')
+
+    if getattr(ts, 'tzinfo', None) is not None:
+        return float(calendar.timegm(ts.utctimetuple()))
+
+    return time.mktime(ts.timetuple())
+
+
+def symbol_diff(old, new):
+    added = [s for s in new if s not in old]
+    removed = [s for s in old if s not in new]
+
+    # NOTE A symbol that disappears while a new one shows up with the same
+    #      name is treated as a rename rather than a delisting and a listing
+    names = dict([(new[s].get('name'), s) for s in added
+                  if new[s].get('name')])
+
+    renamed = {}
+    for s in removed:
+        name = old[s].get('name')
+        if name and name in names:
+            renamed[s] = names.pop(name)
+
+    added = [s for s in added if s not in renamed.values()]
+    removed = [s for s in removed if s not in renamed]
+    return sorted(added), sorted(removed), renamed
+
+
+class SymbolMaster(object):
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _file(self, exchange):
+        return os.path.join(self.directory, '.'.join((exchange, 'pkl')))
+
+    def _load(self, exchange):
+        filename = self._file(exchange)
+        if not os.path.exists(filename):
+            return {'version': 0, 'symbols': {}, 'log': []}
+
+        return load(filename)
+
+    def version(self, exchange):
+        return self._load(exchange)['version']
+
+    def load(self, exchange):
+        return self._load(exchange)['symbols']
+
+    def refresh(self, exchange, symbols, ts=None):
+        master = self._load(exchange)
+        added, removed, renamed = symbol_diff(master['symbols'], symbols)
+
+        entry = None
+        if added or removed or renamed:
+            master['version'] += 1
+            entry = {'version': master['version'], 'ts': epoch(ts),
+                     'added': added, 'removed': removed, 'renamed': renamed}
+            master['log'].append(entry)
+
+        master['symbols'] = symbols
+        dump(master, self._file(exchange))
+        return entry
+
+    def changes_since(self, exchange, ts):
+        ts = epoch(ts)
+        return [e for e in self._load(exchange)['log'] if e['ts'] > ts]
+
+    def changed_since(self, exchange, ts):
+        symbols = set()
+
+        for entry in self.changes_since(exchange, ts):
+            symbols.update(entry['added'])
+            symbols.update(entry['removed'])
+            symbols.update(entry['renamed'])
+            symbols.update(entry['renamed'].values())
+
+        return symbols
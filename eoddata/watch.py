@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+from multiprocessing import pool
+
+import ws
+
+
+LOG = logging.getLogger(__name__)
+
+CHANGE_FIELDS = ('close', 'volume', 'date_time')
+
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def latency_stats(latencies, elapsed):
+    latencies = sorted(latencies)
+    count = len(latencies)
+
+    if not count:
+        return {'requests': 0, 'elapsed': elapsed}
+
+    return {'requests': count,
+            'elapsed': elapsed,
+            'min': latencies[0],
+            'median': latencies[count // 2],
+            'max': latencies[-1],
+            'mean': sum(latencies) / count}
+
+
+class QuoteWatcher(object):
+    def __init__(self, client, exchange, symbols, interval=5, chunk_size=100,
+                 workers=4, fields=CHANGE_FIELDS):
+        self.client = client
+        self.exchange = exchange
+        self.symbols = list(symbols)
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.fields = fields
+        self.last_seen = {}
+        self.stats = None
+        self._pool = None
+
+    def _fetch(self, symbols):
+        start = time.time()
+        quotes = self.client.quotes(self.exchange, symbols=symbols)
+        return quotes, time.time() - start
+
+    def _changed(self, quote):
+        last = self.last_seen.get(quote['symbol'])
+
+        if last is None:
+            return True
+
+        return any(last.get(f) != quote.get(f) for f in self.fields)
+
+    def poll(self):
+        if not self.client.token:
+            self.client.login()
+
+        if self._pool is None:
+            self._pool = pool.ThreadPool(self.workers)
+
+        start = time.time()
+        results = self._pool.map(self._fetch,
+                                 list(chunks(self.symbols, self.chunk_size)))
+        elapsed = time.time() - start
+
+        changed = {}
+        for quotes, _ in results:
+            for symbol, quote in quotes.iteritems():
+                if self._changed(quote):
+                    changed[symbol] = quote
+
+        self.last_seen.update(changed)
+
+        self.stats = latency_stats([latency for _, latency in results],
+                                   elapsed)
+        self.stats['changed'] = len(changed)
+        return changed
+
+    def watch(self, cycles=None):
+        cycle = 0
+
+        try:
+            while cycles is None or cycle < cycles:
+                start = time.time()
+
+                try:
+                    changed = self.poll()
+
+                # NOTE A dropped connection surfaces as IOError (URLError,
+                #      socket.error) rather than ws.Error, neither should end
+                #      the watch loop
+                except (ws.Error, IOError) as e:
+                    LOG.warning("Quote poll for %s failed: %s" %
+                                (self.exchange, e))
+                    changed = {}
+                    self.stats = {'error': str(e),
+                                  'elapsed': time.time() - start}
+
+                yield changed, self.stats
+
+                cycle += 1
+                remaining = self.interval - (time.time() - start)
+
+                if remaining > 0 and (cycles is None or cycle < cycles):
+                    time.sleep(remaining)
+
+        finally:
+            self.close()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
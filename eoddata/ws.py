@@ -1,10 +1,16 @@
 # -*- coding: utf-8 -*-
 
+import collections
 import functools
+import Queue
 import re
+import threading
+import time
 import urllib2
 
-import scio
+import lazy
+
+scio = lazy.LazyModule('scio')
 
 # NOTE(jkoelker) I hate soap so much
 
@@ -12,11 +18,43 @@ WSDL = 'http://ws.eoddata.com/data.asmx?wsdl'
 FIRST_CAP_RE = re.compile('(.)([A-Z][a-z]+)')
 ALL_CAP_RE = re.compile('([a-z0-9])([A-Z])')
 
+# NOTE Every EODData call is a read, but hedging a login would just burn
+#      tokens
+UNHEDGED = ('Login',)
+
 
 class Error(Exception):
     pass
 
 
+class Timeout(Error):
+    pass
+
+
+class LatencyTracker(object):
+    def __init__(self, size=200):
+        self.size = size
+        self.samples = collections.defaultdict(
+            lambda: collections.deque(maxlen=self.size))
+
+    def record(self, method, latency):
+        self.samples[method].append(latency)
+
+    def percentile(self, method, pct, min_samples=20):
+        samples = sorted(self.samples.get(method, ()))
+
+        if len(samples) < min_samples:
+            return None
+
+        return samples[min(len(samples) - 1, int(len(samples) * pct / 100.0))]
+
+    def stats(self):
+        return dict([(method, {'count': len(samples),
+                               'p50': self.percentile(method, 50, 1),
+                               'p99': self.percentile(method, 99, 1)})
+                     for method, samples in self.samples.items()])
+
+
 def convert_date(date):
     if not date:
         return date
@@ -79,6 +117,31 @@ def dictify(obj):
                  if k.startswith('_') and k.endswith('_')])
 
 
+def iter_records(objs, fields=None, name='Record'):
+    if fields is None:
+        for obj in objs:
+            yield dictify(obj)
+
+        return
+
+    record = collections.namedtuple(name, fields)
+    attrs = None
+
+    for obj in objs:
+        if attrs is None:
+            names = dict([(decamelize(k.strip('_')), k) for k in obj.__dict__
+                          if k.startswith('_') and k.endswith('_')])
+            missing = [f for f in fields if f not in names]
+
+            if missing:
+                raise Error('Unknown %s fields: %s' % (name,
+                                                       ', '.join(missing)))
+
+            attrs = [names[f] for f in fields]
+
+        yield record._make([convert(obj.__dict__[a]) for a in attrs])
+
+
 def list_to_dictify(objs, key):
     res = {}
 
@@ -89,17 +152,133 @@ def list_to_dictify(objs, key):
     return res
 
 
+# NOTE A timed out or losing hedged call cannot be cancelled, its thread
+#      keeps running until the server answers or the socket gives up.
+#      `max_threads` bounds how many of those helper threads may be alive
+#      at once: past it hedging is skipped and new timed calls raise Error
+#      instead of piling up more threads behind a stalled server.
 class Client(object):
-    def __init__(self, username, password):
-        self.client = scio.Client(urllib2.urlopen(WSDL))
+    def __init__(self, username, password, timeout=None, timeouts=None,
+                 hedge=False, hedge_percentile=95, hedge_min_samples=20,
+                 max_threads=16):
+        if timeout is None:
+            self.client = scio.Client(urllib2.urlopen(WSDL))
+        else:
+            self.client = scio.Client(urllib2.urlopen(WSDL, timeout=timeout))
+
         self.username = username
         self.password = password
         self.token = None
         self.last_response = None
+        self.timeout = timeout
+        self.timeouts = dict(timeouts or {})
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.latencies = LatencyTracker()
+        self.hedges = 0
+        self.max_threads = max_threads
+        self.threads = 0
+        self._threads_lock = threading.Lock()
+
+    def _call(self, method, func, kwargs, results):
+        start = time.time()
+
+        try:
+            result = (True, func(**kwargs))
+
+        except Exception as e:
+            result = (False, e)
+
+        finally:
+            with self._threads_lock:
+                self.threads -= 1
+
+        # NOTE Abandoned calls still report, so the tail stays visible
+        self.latencies.record(method, time.time() - start)
+        results.put(result)
+
+    def _race(self, method, func, kwargs, timeout, hedge_after):
+        results = Queue.Queue()
+        start = time.time()
+        deadline = None if timeout is None else start + timeout
+        hedge_at = None if hedge_after is None else start + hedge_after
+
+        def attempt():
+            with self._threads_lock:
+                if self.threads >= self.max_threads:
+                    return False
+
+                self.threads += 1
+
+            thread = threading.Thread(target=self._call,
+                                      args=(method, func, kwargs, results))
+            thread.daemon = True
+            thread.start()
+            return True
+
+        if not attempt():
+            raise Error('%s not sent, %d earlier calls are still running' %
+                        (method, self.threads))
+
+        pending = 1
+
+        while True:
+            waits = [t - time.time() for t in (deadline, hedge_at)
+                     if t is not None]
+            wait = max(0, min(waits)) if waits else None
+
+            try:
+                ok, value = results.get(timeout=wait)
+
+            except Queue.Empty:
+                now = time.time()
+                if (hedge_at is not None and now >= hedge_at and
+                        (deadline is None or now < deadline)):
+                    hedge_at = None
+
+                    if attempt():
+                        self.hedges += 1
+                        pending += 1
+
+                    continue
+
+                if deadline is not None and now >= deadline:
+                    raise Timeout('%s took longer than %ss' % (method,
+                                                               timeout))
+
+                continue
+
+            pending -= 1
+
+            if ok:
+                return value
+
+            # NOTE Only give up on an error when nothing else is in flight
+            if not pending:
+                raise value
+
+            hedge_at = None
 
     def _get(self, method, **kwargs):
         func = getattr(self.client.service, method)
-        self.last_response = func(**kwargs)
+        timeout = self.timeouts.get(method, self.timeout)
+
+        hedge_after = None
+        if self.hedge and method not in UNHEDGED:
+            hedge_after = self.latencies.percentile(method,
+                                                    self.hedge_percentile,
+                                                    self.hedge_min_samples)
+
+        if timeout is None and hedge_after is None:
+            start = time.time()
+            self.last_response = func(**kwargs)
+            self.latencies.record(method, time.time() - start)
+
+        else:
+            self.last_response = self._race(method, func, kwargs, timeout,
+                                            hedge_after)
+
         return self.last_response
 
     def _result(self, method, processor=None, **kwargs):
@@ -147,6 +326,13 @@ class Client(object):
                                                 'symbol')
         return self._result(method, processor, Exchange=exchange)
 
+    @require_login
+    def iter_fundamentals(self, exchange, fields=None):
+        method = 'FundamentalList'
+        processor = lambda obj: obj.FUNDAMENTALS.FUNDAMENTAL
+        objs = self._result(method, processor, Exchange=exchange)
+        return iter_records(objs, fields, 'Fundamental')
+
     @require_login
     def quote(self, exchange, symbol):
         method = 'QuoteGet'
@@ -154,10 +340,8 @@ class Client(object):
         return self._result(method, processor, Exchange=exchange,
                             Symbol=symbol)
 
-    # NOTE(jkoelker) Period queries don't seem to have intraday data. Need to
-    #                investigate
-    @require_login
-    def quotes(self, exchange, symbols=None, date=None, period=None):
+    @staticmethod
+    def _quotes_args(exchange, symbols=None, date=None, period=None):
         method = 'QuoteList'
         kwargs = {'Exchange': exchange}
 
@@ -177,9 +361,26 @@ class Client(object):
                 method = 'QuoteListByDatePeriod'
                 kwargs['period'] = period
 
+        return method, kwargs
+
+    # NOTE(jkoelker) Period queries don't seem to have intraday data. Need to
+    #                investigate
+    @require_login
+    def quotes(self, exchange, symbols=None, date=None, period=None):
+        method, kwargs = self._quotes_args(exchange, symbols, date, period)
         processor = lambda obj: list_to_dictify(obj.QUOTES.QUOTE, 'symbol')
         return self._result(method, processor, **kwargs)
 
+    # NOTE The iter_* variants decode one record at a time as they are
+    #      consumed. With `fields` they yield namedtuples holding only those
+    #      fields instead of full dicts.
+    @require_login
+    def iter_quotes(self, exchange, symbols=None, date=None, period=None,
+                    fields=None):
+        method, kwargs = self._quotes_args(exchange, symbols, date, period)
+        objs = self._result(method, lambda obj: obj.QUOTES.QUOTE, **kwargs)
+        return iter_records(objs, fields, 'Quote')
+
     @require_login
     def history(self, exchange, symbol, start, end=None, period=None):
         method = 'SymbolHistory'
@@ -210,9 +411,23 @@ class Client(object):
         processor = lambda obj: list_to_dictify(obj.SYMBOLS.SYMBOL, 'code')
         return self._result(method, processor, Exchange=exchange)
 
+    @require_login
+    def iter_symbols(self, exchange, fields=None):
+        method = 'SymbolList'
+        processor = lambda obj: obj.SYMBOLS.SYMBOL
+        objs = self._result(method, processor, Exchange=exchange)
+        return iter_records(objs, fields, 'Symbol')
+
     @require_login
     def technicals(self, exchange):
         method = 'TechnicalList'
         processor = lambda obj: list_to_dictify(obj.TECHNICALS.TECHNICAL,
                                                 'symbol')
         return self._result(method, processor, Exchange=exchange)
+
+    @require_login
+    def iter_technicals(self, exchange, fields=None):
+        method = 'TechnicalList'
+        processor = lambda obj: obj.TECHNICALS.TECHNICAL
+        objs = self._result(method, processor, Exchange=exchange)
+        return iter_records(objs, fields, 'Technical')